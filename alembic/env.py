@@ -8,6 +8,8 @@ from sqlmodel import SQLModel
 # Если этого не сделать, Alembic подумает, что база пустая
 from app.modules.auth.models import User
 from app.modules.ledger.models import Transaction
+from app.modules.storage.models import Blob
+from app.modules.archive.models import ArchiveSegment
 from app.core.config import settings
 
 config = context.config
@@ -0,0 +1,39 @@
+"""Add ledger_checkpoints table
+
+Revision ID: 4e1a7c9b2d10
+Revises: cf6314260c5d
+Create Date: 2026-01-12 18:04:11.207315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e1a7c9b2d10'
+down_revision: Union[str, Sequence[str], None] = 'cf6314260c5d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ledger_checkpoints',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('last_tx_id', sa.Integer(), nullable=False),
+    sa.Column('last_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('verified_count', sa.Integer(), nullable=False),
+    sa.Column('signature', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ledger_checkpoints_last_tx_id'), 'ledger_checkpoints', ['last_tx_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ledger_checkpoints_last_tx_id'), table_name='ledger_checkpoints')
+    op.drop_table('ledger_checkpoints')
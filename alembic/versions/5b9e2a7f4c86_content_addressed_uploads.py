@@ -0,0 +1,42 @@
+"""Content-addressed upload storage
+
+Revision ID: 5b9e2a7f4c86
+Revises: e71b0c4d95f3
+Create Date: 2026-01-27 14:51:22.405196
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b9e2a7f4c86'
+down_revision: Union[str, Sequence[str], None] = 'e71b0c4d95f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('blobs',
+    sa.Column('sha256', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('file_type', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    op.add_column('proofs', sa.Column('blob_sha256', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.create_index(op.f('ix_proofs_blob_sha256'), 'proofs', ['blob_sha256'], unique=False)
+    op.add_column('posts', sa.Column('image_sha256', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('posts', 'image_sha256')
+    op.drop_index(op.f('ix_proofs_blob_sha256'), table_name='proofs')
+    op.drop_column('proofs', 'blob_sha256')
+    op.drop_table('blobs')
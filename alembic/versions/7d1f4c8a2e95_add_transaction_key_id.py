@@ -0,0 +1,67 @@
+"""Record which admin key signed each ledger transaction
+
+key_id = admin_keys.id ключа, которым подписана транзакция (NULL — системный ключ).
+Для уже записанных транзакций key_id восстанавливается проверкой подписи: запись админа,
+сделанная до выпуска его ключа (или воркером со старым keystore), подписана системой
+и остается с NULL.
+
+Revision ID: 7d1f4c8a2e95
+Revises: b5e83f1a6c47
+Create Date: 2026-02-18 14:05:37.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from nacl.encoding import HexEncoder
+from nacl.exceptions import CryptoError
+from nacl.signing import VerifyKey
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d1f4c8a2e95'
+down_revision: Union[str, Sequence[str], None] = 'b5e83f1a6c47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH = 5000
+
+
+def _signed_by(verify_key: VerifyKey, current_hash: str, signature: str) -> bool:
+    try:
+        return verify_key.verify(signature.encode(), encoder=HexEncoder) == current_hash.encode()
+    except (CryptoError, ValueError, TypeError):
+        return False
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ledger_transactions', sa.Column('key_id', sa.Integer(), nullable=True))
+
+    bind = op.get_bind()
+    for key_id, admin_id, public_key in bind.execute(sa.text('SELECT id, admin_id, public_key FROM admin_keys')).all():
+        verify_key = VerifyKey(public_key, encoder=HexEncoder)
+        after_id = 0
+        while True:
+            rows = bind.execute(
+                sa.text('SELECT id, current_hash, signature FROM ledger_transactions '
+                        'WHERE admin_id = :admin_id AND id > :after_id ORDER BY id LIMIT :limit'),
+                {'admin_id': admin_id, 'after_id': after_id, 'limit': BATCH},
+            ).all()
+            if not rows:
+                break
+            signed = [tx_id for tx_id, current_hash, signature in rows if _signed_by(verify_key, current_hash, signature)]
+            if signed:
+                bind.execute(
+                    sa.text('UPDATE ledger_transactions SET key_id = :key_id WHERE id IN :ids')
+                    .bindparams(sa.bindparam('ids', expanding=True)),
+                    {'key_id': key_id, 'ids': signed},
+                )
+            after_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('ledger_transactions') as batch_op:
+        batch_op.drop_column('key_id')
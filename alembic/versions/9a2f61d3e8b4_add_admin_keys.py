@@ -0,0 +1,37 @@
+"""Add admin_keys table
+
+Revision ID: 9a2f61d3e8b4
+Revises: 4e1a7c9b2d10
+Create Date: 2026-01-14 11:27:45.913402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a2f61d3e8b4'
+down_revision: Union[str, Sequence[str], None] = '4e1a7c9b2d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('admin_keys',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('admin_id', sa.Integer(), nullable=False),
+    sa.Column('public_key', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_admin_keys_admin_id'), 'admin_keys', ['admin_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_admin_keys_admin_id'), table_name='admin_keys')
+    op.drop_table('admin_keys')
@@ -0,0 +1,33 @@
+"""Thumbnail and preview columns for posts and proofs
+
+Revision ID: a8c4d7e19b52
+Revises: 5b9e2a7f4c86
+Create Date: 2026-01-30 12:08:55.731904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8c4d7e19b52'
+down_revision: Union[str, Sequence[str], None] = '5b9e2a7f4c86'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('posts', sa.Column('thumbnail_url', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.add_column('proofs', sa.Column('thumbnail_url', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.add_column('proofs', sa.Column('preview_url', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('proofs', 'preview_url')
+    op.drop_column('proofs', 'thumbnail_url')
+    op.drop_column('posts', 'thumbnail_url')
@@ -0,0 +1,124 @@
+"""Partition audit_logs by month, add search indexes
+
+В Postgres audit_logs пересоздается как RANGE-секционированная по timestamp таблица:
+секция на каждый месяц от самой старой записи до AUDIT_PARTITION_MONTHS_AHEAD вперед плюс
+audit_logs_default. Строки копируются одним INSERT ... SELECT, id продолжают ту же последовательность.
+Дальше секции создает app.modules.audit.partitions.
+
+На остальных СУБД (SQLite для разработки) добавляются только обычные индексы.
+
+Revision ID: b5e83f1a6c47
+Revises: 0c7e5b3f9d28
+Create Date: 2026-02-16 10:18:52.640117
+
+"""
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e83f1a6c47'
+down_revision: Union[str, Sequence[str], None] = '0c7e5b3f9d28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+BTREE_INDEXES = [
+    ('ix_audit_logs_action_timestamp', ['action', 'timestamp']),
+    ('ix_audit_logs_actor_timestamp', ['actor_id', 'timestamp']),
+    ('ix_audit_logs_timestamp', ['timestamp']),
+]
+
+COLUMNS = 'id, actor_id, action, details, "timestamp"'
+
+
+def _month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        for name, columns in BTREE_INDEXES:
+            op.create_index(name, 'audit_logs', columns, unique=False)
+        return
+
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence('audit_logs', 'id')")).scalar()
+    oldest = bind.execute(sa.text('SELECT min("timestamp") FROM audit_logs')).scalar()
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('ALTER TABLE audit_logs RENAME TO audit_logs_legacy')
+    op.execute('ALTER TABLE audit_logs_legacy RENAME CONSTRAINT audit_logs_pkey TO audit_logs_legacy_pkey')
+    for name, _ in BTREE_INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')  # Если таблицу создал create_all по новой модели
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')  # Иначе DROP старой таблицы унесет последовательность
+
+    # Ключ секционирования обязан входить в первичный ключ
+    op.execute(f"""
+        CREATE TABLE audit_logs (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'::regclass),
+            actor_id INTEGER,
+            action VARCHAR NOT NULL,
+            details VARCHAR NOT NULL,
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            CONSTRAINT audit_logs_pkey PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    """)
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY audit_logs.id')
+    op.execute('CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT')
+
+    month = _month_start(oldest or datetime.utcnow())
+    last = _month_start(datetime.utcnow())
+    for _ in range(MONTHS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        end = _next_month(month)
+        op.execute(
+            f"CREATE TABLE audit_logs_p{month:%Y%m} PARTITION OF audit_logs "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+        month = end
+
+    # Индексы на родителе создаются в каждой секции, в том числе будущих
+    for name, columns in BTREE_INDEXES:
+        op.create_index(name, 'audit_logs', columns, unique=False)
+    op.execute('CREATE INDEX ix_audit_logs_details_trgm ON audit_logs USING gin (details gin_trgm_ops)')
+
+    op.execute(f'INSERT INTO audit_logs ({COLUMNS}) SELECT {COLUMNS} FROM audit_logs_legacy')
+    op.execute('DROP TABLE audit_logs_legacy')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        for name, _ in reversed(BTREE_INDEXES):
+            op.drop_index(name, table_name='audit_logs')
+        return
+
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence('audit_logs', 'id')")).scalar()
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+    op.execute('ALTER TABLE audit_logs RENAME TO audit_logs_partitioned')
+    op.execute('ALTER TABLE audit_logs_partitioned RENAME CONSTRAINT audit_logs_pkey TO audit_logs_partitioned_pkey')
+    op.execute(f"""
+        CREATE TABLE audit_logs (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'::regclass),
+            actor_id INTEGER,
+            action VARCHAR NOT NULL,
+            details VARCHAR NOT NULL,
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            CONSTRAINT audit_logs_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY audit_logs.id')
+    op.execute(f'INSERT INTO audit_logs ({COLUMNS}) SELECT {COLUMNS} FROM audit_logs_partitioned')
+    op.execute('DROP TABLE audit_logs_partitioned')  # Вместе с секциями и их индексами
@@ -0,0 +1,29 @@
+"""Composite index for ledger history keyset pagination
+
+Revision ID: c3d85e0f7a21
+Revises: 9a2f61d3e8b4
+Create Date: 2026-01-20 16:42:03.118530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d85e0f7a21'
+down_revision: Union[str, Sequence[str], None] = '9a2f61d3e8b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_ledger_transactions_user_created_id', 'ledger_transactions',
+                    ['target_user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ledger_transactions_user_created_id', table_name='ledger_transactions')
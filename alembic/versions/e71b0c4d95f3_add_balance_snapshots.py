@@ -0,0 +1,34 @@
+"""Add balance_snapshots table
+
+Revision ID: e71b0c4d95f3
+Revises: c3d85e0f7a21
+Create Date: 2026-01-23 10:15:37.640218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e71b0c4d95f3'
+down_revision: Union[str, Sequence[str], None] = 'c3d85e0f7a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('balance_snapshots',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('last_tx_id', sa.Integer(), nullable=False),
+    sa.Column('balance', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('balance_snapshots')
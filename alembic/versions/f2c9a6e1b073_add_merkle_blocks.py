@@ -0,0 +1,41 @@
+"""Add ledger_merkle_blocks table
+
+Revision ID: f2c9a6e1b073
+Revises: d4b7e2a9c315
+Create Date: 2026-02-06 16:22:04.913570
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c9a6e1b073'
+down_revision: Union[str, Sequence[str], None] = 'd4b7e2a9c315'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ledger_merkle_blocks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('first_tx_id', sa.Integer(), nullable=False),
+    sa.Column('last_tx_id', sa.Integer(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('root', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('prev_root', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('signature', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ledger_merkle_blocks_last_tx_id'), 'ledger_merkle_blocks', ['last_tx_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ledger_merkle_blocks_last_tx_id'), table_name='ledger_merkle_blocks')
+    op.drop_table('ledger_merkle_blocks')
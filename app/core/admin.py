@@ -1,8 +1,15 @@
+from datetime import datetime, timedelta
+from markupsafe import Markup
 from sqladmin import ModelView, Admin
 from app.modules.auth.models import User
 from app.modules.ledger.models import Transaction
 from app.modules.proofs.models import Proof
 from app.modules.audit.models import AuditLog
+from app.modules.audit.service import search_conditions
+from app.modules.auth.cache import user_cache
+from app.modules.storage.service import purge_files, release_blob
+from app.core.config import settings
+from app.core.db import async_session_maker
 
 # 1. Настройка отображения Юзеров
 class UserAdmin(ModelView, model=User):
@@ -13,6 +20,15 @@ class UserAdmin(ModelView, model=User):
     name = "Студент/Сотрудник"
     name_plural = "Пользователи"
 
+    # Правка в админке (роль, баланс, деактивация) должна сразу сбрасывать кэш пользователя
+    async def after_model_change(self, data, model, is_created, request):
+        await user_cache.invalidate_id(model.id)
+        await user_cache.invalidate(model.username)
+
+    async def after_model_delete(self, model, request):
+        await user_cache.invalidate_id(model.id)
+        await user_cache.invalidate(model.username)
+
 # 2. Настройка отображения Транзакций (Леджера)
 class TransactionAdmin(ModelView, model=Transaction):
     column_list = [Transaction.id, Transaction.amount, Transaction.reason, Transaction.created_at]
@@ -26,13 +42,33 @@ class TransactionAdmin(ModelView, model=Transaction):
 
 # 3. Настройка отображения Файлов (Proofs)
 class ProofAdmin(ModelView, model=Proof):
-    column_list = [Proof.id, Proof.user_id, Proof.filename, Proof.status, Proof.created_at]
+    column_list = [Proof.id, Proof.thumbnail_url, Proof.user_id, Proof.filename, Proof.status, Proof.created_at]
+    column_details_list = [Proof.id, Proof.preview_url, Proof.user_id, Proof.filename, Proof.description,
+                           Proof.status, Proof.admin_comment, Proof.created_at]
     column_sortable_list = [Proof.created_at, Proof.status]
-    column_labels = {Proof.user_id: "ID Студента", Proof.filename: "Имя файла"}
+    column_labels = {Proof.user_id: "ID Студента", Proof.filename: "Имя файла",
+                     Proof.thumbnail_url: "Превью", Proof.preview_url: "Превью"}
+    # В списке — миниатюра, в карточке — превью первой страницы; оригинал открывается по клику
+    column_formatters = {
+        Proof.thumbnail_url: lambda m, a: Markup(f'<img src="{m.thumbnail_url}" height="48">') if m.thumbnail_url else ""
+    }
+    column_formatters_detail = {
+        Proof.preview_url: lambda m, a: Markup(
+            f'<a href="/static/{m.file_path.removeprefix("uploads/")}" target="_blank">'
+            f'<img src="{m.preview_url}" style="max-width: 640px"></a>'
+        ) if m.preview_url else ""
+    }
     icon = "fa-solid fa-file-contract"
     name = "Доказательство"
     name_plural = "Загруженные файлы"
 
+    # Файл общий для всех одинаковых загрузок — снимаем ссылку, а удаляет его хранилище
+    async def after_model_delete(self, model, request):
+        async with async_session_maker() as session:
+            orphaned = await release_blob(session, model.blob_sha256)
+            await session.commit()
+        await purge_files(orphaned)
+
 # 4. Настройка Журнала Безопасности (Audit)
 class AuditAdmin(ModelView, model=AuditLog):
     column_list = [AuditLog.id, AuditLog.timestamp, AuditLog.action, AuditLog.details, AuditLog.actor_id]
@@ -45,6 +81,13 @@ class AuditAdmin(ModelView, model=AuditLog):
     name = "Запись лога"
     name_plural = "Журнал Безопасности"
 
+    # Стандартный поиск — ILIKE по всей таблице; ограничиваем окном, чтобы Postgres читал только свежие секции.
+    # Старые события — через GET /audit/search с явными since/until
+    def search_query(self, stmt, term):
+        until = datetime.utcnow()
+        since = until - timedelta(days=settings.AUDIT_SEARCH_DEFAULT_DAYS)
+        return stmt.where(*search_conditions(since, until, contains=term, any_column=True))
+
 # 5. Функция инициализации
 def setup_admin(app, engine):
     admin = Admin(app, engine, title="Kiibiki Admin Panel")
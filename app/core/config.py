@@ -1,3 +1,4 @@
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -7,6 +8,94 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     SECRET_KEY: str
     ALGORITHM: str
+    DEBUG: bool = False
+
+    # Пул соединений к БД
+    DB_ECHO: Optional[bool] = None  # None = как DEBUG; логирование SQL заметно режет пропускную способность
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    DB_STATEMENT_CACHE_SIZE: int = 100  # Кэш prepared statements asyncpg (0 — если за pgbouncer в transaction mode)
+
+    # Приватный ключ Ed25519 (hex), которым система подписывает начисления через API
+    LEDGER_SIGNING_KEY: Optional[str] = None
+    # JSON-файл с личными ключами админов {"<admin_id>": "<hex>"}; без него все подписывает система
+    LEDGER_KEYSTORE_PATH: Optional[str] = None
+    LEDGER_BULK_MAX_RECIPIENTS: int = 5000
+    # Idempotency-Key на начислениях: сколько хранить ответ, сколько держать в памяти воркера
+    # и через сколько секунд ключ без ответа считается зависшим (показывается в `idempotency pending`)
+    LEDGER_IDEMPOTENCY_TTL_HOURS: int = 24
+    LEDGER_IDEMPOTENCY_CACHE_SIZE: int = 10000
+    LEDGER_IDEMPOTENCY_PENDING_TIMEOUT: float = 60
+    # Блоки Меркла: максимум транзакций в блоке и через сколько секунд закрывать неполный
+    LEDGER_MERKLE_BLOCK_SIZE: int = 1024
+    LEDGER_MERKLE_SEAL_INTERVAL: float = 60
+
+    # Кэш пользователей для get_current_user
+    AUTH_CACHE_TTL_SECONDS: float = 60
+    AUTH_CACHE_MAX_SIZE: int = 10000
+
+    # Выключается только для нагрузочных прогонов
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_STORAGE_URI: str = "memory://"  # В проде с несколькими воркерами — redis://redis:6379/0
+    RATE_LIMIT_STRATEGY: Literal["fixed-window", "moving-window"] = "moving-window"
+    RATE_LIMIT_LOGIN_PER_USERNAME: str = "10/minute"
+
+    # Фоновая запись журнала безопасности
+    AUDIT_QUEUE_SIZE: int = 10000
+    AUDIT_FLUSH_BATCH: int = 500
+    AUDIT_FLUSH_INTERVAL: float = 1.0
+    AUDIT_SPILL_PATH: str = "audit_spill.jsonl"  # Каждый процесс пишет в свой audit_spill.<pid>.jsonl рядом
+    # Месячные секции audit_logs создаются заранее на столько месяцев вперед
+    AUDIT_PARTITION_MONTHS_AHEAD: int = 3
+    # Поиск по журналу: окно по умолчанию и максимальное (в днях) и потолок времени одного запроса
+    AUDIT_SEARCH_DEFAULT_DAYS: int = 7
+    AUDIT_SEARCH_MAX_DAYS: int = 93
+    AUDIT_SEARCH_TIMEOUT_MS: int = 5000
+
+    # Архив закрытых периодов леджера и журнала аудита (сегменты, см. app/modules/archive).
+    # Каталог общий для CLI архивации и всех воркеров API; относительный путь — от корня проекта
+    ARCHIVE_DIR: str = "archive"
+    ARCHIVE_BLOCK_RECORDS: int = 512  # Записей в сжатом блоке сегмента
+
+    # Лимиты размера загрузок
+    UPLOAD_MAX_PROOF_BYTES: int = 20 * 1024 * 1024
+    UPLOAD_MAX_IMAGE_BYTES: int = 10 * 1024 * 1024
+
+    # Кэш ленты постов
+    FEED_CACHE_TTL_SECONDS: float = 30
+    FEED_CACHE_MAX_PAGES: int = 256
+    FEED_PAGE_SIZE: int = 20
+
+    # Раздача /static: none — сам воркер, x-accel — nginx (X-Accel-Redirect), x-sendfile — Apache/lighttpd
+    STATIC_OFFLOAD: Literal["none", "x-accel", "x-sendfile"] = "none"
+    STATIC_ACCEL_PREFIX: str = "/_uploads/"  # internal location в nginx, смотрящий в каталог uploads
+    STATIC_MAX_AGE: int = 3600  # Для файлов без хеша в имени
+
+    # Процессы для миниатюр и превью загрузок
+    DERIVATIVE_WORKERS: int = 2
+
+    # Пул для bcrypt: сколько хешей считаем параллельно и сколько запросов может ждать в очереди
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    PASSWORD_HASH_QUEUE_TIMEOUT: float = 5.0
+
+    # Рейтинг: как часто дочитывать транзакции других воркеров и сколько клиенту можно кэшировать ответ
+    LEADERBOARD_REFRESH_INTERVAL: float = 5.0
+    LEADERBOARD_MAX_AGE: int = 10
+    LEADERBOARD_MAX_LIMIT: int = 100
+
+    # /metrics: общий каталог для снимков воркеров (None — только метрики текущего процесса)
+    METRICS_DIR: Optional[str] = None
+    METRICS_FLUSH_INTERVAL: float = 5.0
+
+    # Логи
+    LOG_LEVEL: str = "INFO"
+    LOG_QUEUE_SIZE: int = 10000  # При переполнении записи отбрасываются, а не тормозят запросы
+    LOG_INFO_SAMPLE_RATE: float = 1.0  # Доля запросов, чьи INFO-записи попадают в лог
 
     class Config:
         env_file = ".env"
@@ -1,13 +1,144 @@
+import re
+import time
+from functools import lru_cache
 from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine
 from app.core.config import settings
+from app.core.metrics import db_pool_wait, db_query_duration, metrics
 
-engine = create_async_engine(settings.DATABASE_URL, echo=True, future=True)
 
-async def get_session() -> AsyncSession:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
+class PoolMetrics:
+    """Счетчики пула: сколько ждали свободное соединение и сколько их сейчас на руках"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checked_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float):
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "checked_out": self.checked_out,
+            "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            "timeouts": self.timeouts,
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Очередь соединений, которая засекает время ожидания при выдаче соединения"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            pool_metrics.record_wait(waited)
+            db_pool_wait.observe(waited)
+
+
+def _engine_options() -> dict:
+    options = {"echo": settings.DEBUG if settings.DB_ECHO is None else settings.DB_ECHO, "future": True}
+    if settings.DATABASE_URL.startswith("sqlite"):
+        return options  # У sqlite свой пул, настройки ниже к нему не относятся
+
+    options.update(
+        poolclass=InstrumentedPool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
     )
-    async with async_session() as session:
+    if settings.DATABASE_URL.startswith("postgresql+asyncpg"):
+        options["connect_args"] = {
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)},
+        }
+    return options
+
+
+engine = create_async_engine(settings.DATABASE_URL, **_engine_options())
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_metrics.checkouts += 1
+    pool_metrics.checked_out += 1
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    pool_metrics.checked_out -= 1
+
+
+# Таблица из текста запроса: метка по сырому SQL дала бы бесконечное число серий
+_STATEMENT_TABLE = re.compile(r'^\s*(\w+)\b(?:.*?\b(?:FROM|INTO))?\s+"?(\w+)', re.IGNORECASE | re.DOTALL)
+
+
+@lru_cache(maxsize=2048)
+def _statement_labels(statement: str):
+    match = _STATEMENT_TABLE.match(statement)
+    if match is None:
+        return statement.split(None, 1)[0].upper() if statement.strip() else "OTHER", ""
+    return match.group(1).upper(), match.group(2)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    db_query_duration.observe(elapsed, *_statement_labels(statement))
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _on_error(exception_context):
+    # after_cursor_execute при ошибке не вызывается — снимаем метку старта сами
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+metrics.gauge("db_pool_checked_out", "Соединений сейчас выдано из пула", lambda: pool_metrics.checked_out)
+
+
+def pool_stats() -> dict:
+    stats = pool_metrics.snapshot()
+    stats["status"] = engine.pool.status()
+    return stats
+
+
+# Фабрика сессий одна на процесс, а не новая на каждый запрос
+async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def get_session() -> AsyncSession:
+    async with async_session_maker() as session:
         yield session
+
+
+def dialect_insert(session: AsyncSession):
+    """insert() с поддержкой on_conflict_do_update для текущей БД (Postgres в проде, SQLite локально)"""
+    return pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
@@ -1,5 +1,36 @@
+from fastapi import HTTPException
+from limits import parse
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
 
-# Лимитер, привязанный к IP адресу
-limiter = Limiter(key_func=get_remote_address)
+# Лимитер, привязанный к IP адресу.
+# Счетчики лежат в общем хранилище (RATE_LIMIT_STORAGE_URI, например redis://redis:6379/0), поэтому лимит
+# общий для всех воркеров uvicorn и переживает рестарт. memory:// — только для одного процесса.
+# Скользящее окно в Redis считается Lua-скриптом: проверка и инкремент за один round-trip.
+# Инкременты не копятся и не сбрасываются пачками: отложенный счетчик пропускает всплеск мимо лимита
+# в каждом воркере, то есть возвращает тот же лимит x N, от которого общее хранилище и спасает.
+limiter = Limiter(
+    key_func=get_remote_address,
+    enabled=settings.RATE_LIMIT_ENABLED,
+    storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+    strategy=settings.RATE_LIMIT_STRATEGY,
+    key_prefix="kiibiki",
+    in_memory_fallback_enabled=True,  # Упал Redis — лимитируем локально, а не роняем логин
+)
+
+# Лимит на учетку: перебор пароля одного пользователя с разных IP
+LOGIN_PER_USERNAME = parse(settings.RATE_LIMIT_LOGIN_PER_USERNAME)
+
+
+async def check_username_limit(username: str):
+    """Считает попытку входа в учетку username; при превышении — 429"""
+    if not limiter.enabled:
+        return
+    # hit синхронный, а с Redis это сетевой round-trip — в пул потоков, не в event loop
+    allowed = await run_in_threadpool(
+        limiter.limiter.hit, LOGIN_PER_USERNAME, "login-username", username.strip().lower()
+    )
+    if not allowed:
+        raise HTTPException(status_code=429, detail="Слишком много попыток входа в эту учетную запись")
@@ -1,25 +1,138 @@
-import logging
+"""
+Логи в JSON без задержек на пути запроса.
+
+Event loop только кладет запись в ограниченную очередь (QueueHandler), а кодирование в JSON
+и запись в stdout делает отдельный поток QueueListener. Если stdout тормозит (драйвер логов
+контейнера) и очередь переполнилась, запись отбрасывается и считается, а запрос не ждет.
+
+К каждой записи добавляются request_id / user_id из contextvars (их выставляют
+RequestContextMiddleware и get_current_user). INFO и ниже можно сэмплировать (LOG_INFO_SAMPLE_RATE):
+решение принимается по request_id, так что у запроса остаются либо все записи, либо ни одной.
+"""
+import atexit
 import json
+import logging
+import queue
+import random
 import sys
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+user_id_var: ContextVar[Optional[int]] = ContextVar("user_id", default=None)
+
+
+def _dumps(data: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode()
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
 
 class JsonFormatter(logging.Formatter):
     def format(self, record):
         log_record = {
-            "timestamp": self.formatTime(record),
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
             "level": record.levelname,
             "message": record.getMessage(),
             "module": record.module,
         }
-        if record.exc_info:
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            log_record["request_id"] = request_id
+        user_id = getattr(record, "user_id", None)
+        if user_id is not None:
+            log_record["user_id"] = user_id
+        if record.exc_text:
+            log_record["exception"] = record.exc_text
+        elif record.exc_info:
             log_record["exception"] = self.formatException(record.exc_info)
-        return json.dumps(log_record)
+        return _dumps(log_record)
+
+
+class ContextFilter(logging.Filter):
+    """Снимает contextvars в потоке, где пишется лог (в потоке listener'а их уже не видно)"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.user_id = user_id_var.get()
+        return True
+
 
-def setup_logging():
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rate записей уровня INFO и ниже; WARNING и выше — всегда"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self._threshold = int(max(0.0, min(rate, 1.0)) * 10_000)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self._threshold >= 10_000:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            return random.randrange(10_000) < self._threshold
+        return zlib.crc32(request_id.encode()) % 10_000 < self._threshold
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # В отличие от базового prepare не форматирует запись: JSON собирается в потоке listener'а.
+        # Аргументы подставляем сразу — они могут измениться, пока запись ждет в очереди.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging() -> logging.Logger:
+    """Настраивает логгер kiibiki; повторный вызов ничего не добавляет"""
+    global _listener
     logger = logging.getLogger("kiibiki")
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(JsonFormatter())
+    if _listener is not None:
+        return logger
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(SamplingFilter(settings.LOG_INFO_SAMPLE_RATE))
+
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
     logger.addHandler(handler)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(settings.LOG_LEVEL)
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # Дописывает хвост очереди при выходе
     return logger
 
+
 logger = setup_logging()
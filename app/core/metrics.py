@@ -0,0 +1,224 @@
+"""
+Метрики процесса в формате Prometheus (text exposition 0.0.4).
+
+Каждый воркер uvicorn считает метрики у себя в памяти. Блокировок нет: все наблюдения делаются
+из потока event loop (события SQLAlchemy async-движка тоже выполняются в нем).
+Если задан METRICS_DIR, воркер раз в METRICS_FLUSH_INTERVAL сбрасывает снимок в METRICS_DIR/<pid>.json,
+а /metrics отдает сумму снимков всех живых воркеров — неважно, в какой воркер попал скрейп.
+Без METRICS_DIR отдаются метрики только текущего процесса.
+"""
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+LabelValues = Tuple[str, ...]
+
+# Секунды: от быстрых SELECT по индексу до bcrypt и медленных выгрузок
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._series: Dict[LabelValues, object] = {}
+
+    def dump(self) -> dict:
+        return {
+            "type": self.type,
+            "help": self.help,
+            "labels": list(self.labels),
+            "series": [[list(key), value] for key, value in self._series.items()],
+        }
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        self._series[label_values] = self._series.get(label_values, 0.0) + amount
+
+
+class Gauge(Metric):
+    """Значение снимается в момент выгрузки — удобно для глубин очередей и состояния пула"""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, callback: Callable[[], float]):
+        super().__init__(name, help)
+        self._callback = callback
+
+    def dump(self) -> dict:
+        self._series = {(): float(self._callback())}
+        return super().dump()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *label_values: str):
+        series = self._series.get(label_values)
+        if series is None:
+            # Последняя корзина — +Inf; счетчики не накопительные, суммируются при выгрузке
+            series = self._series[label_values] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+        series["counts"][bisect_left(self.buckets, value)] += 1
+        series["sum"] += value
+
+    def dump(self) -> dict:
+        data = super().dump()
+        data["buckets"] = list(self.buckets)
+        return data
+
+
+class MetricsRegistry:
+    def __init__(self, directory: Optional[str], flush_interval: float):
+        self._metrics: Dict[str, Metric] = {}
+        self._dir = Path(directory) if directory else None
+        self._flush_interval = flush_interval
+        self._task: Optional[asyncio.Task] = None
+
+    def _register(self, metric: Metric) -> Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, callback: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, help, callback))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def snapshot(self) -> dict:
+        return {name: metric.dump() for name, metric in self._metrics.items()}
+
+    # --- Несколько воркеров ---
+
+    @property
+    def _own_file(self) -> Path:
+        return self._dir / f"{os.getpid()}.json"
+
+    def _write(self, payload: str):
+        self._dir.mkdir(parents=True, exist_ok=True)
+        tmp = self._own_file.with_suffix(".tmp")
+        tmp.write_text(payload)
+        tmp.replace(self._own_file)
+
+    def start(self):
+        if self._dir is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run(), name="metrics-flush")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        # Остановленный воркер больше не считается: его снимок убираем сразу, а не ждем устаревания
+        self._own_file.unlink(missing_ok=True)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            payload = json.dumps(self.snapshot())  # Снимок — в потоке event loop, запись файла — в пуле
+            await loop.run_in_executor(None, self._write, payload)
+
+    def _collect(self, live: dict) -> dict:
+        """Складывает снимок текущего процесса со снимками остальных живых воркеров"""
+        merged = json.loads(json.dumps(live))
+        if self._dir is None or not self._dir.exists():
+            return merged
+
+        # Воркер, не обновлявший файл несколько интервалов, считаем умершим (его счетчики пропадут,
+        # Prometheus воспримет это как сброс счетчика)
+        fresh_after = time.time() - self._flush_interval * 6
+        for path in self._dir.glob("*.json"):
+            if path == self._own_file:
+                continue
+            try:
+                if path.stat().st_mtime < fresh_after:
+                    continue
+                other = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # Файл удалили или дописывают прямо сейчас
+            for name, data in other.items():
+                if name not in merged:
+                    merged[name] = data
+                    continue
+                series = {tuple(key): value for key, value in merged[name]["series"]}
+                for key, value in data["series"]:
+                    key = tuple(key)
+                    if key not in series:
+                        series[key] = value
+                    elif isinstance(value, dict):
+                        series[key] = {
+                            "counts": [a + b for a, b in zip(series[key]["counts"], value["counts"])],
+                            "sum": series[key]["sum"] + value["sum"],
+                        }
+                    else:
+                        series[key] += value
+                merged[name]["series"] = [[list(key), value] for key, value in series.items()]
+        return merged
+
+    def _render(self, live: dict) -> str:
+        lines: List[str] = []
+        for name, data in sorted(self._collect(live).items()):
+            lines.append(f"# HELP {name} {data['help']}")
+            lines.append(f"# TYPE {name} {data['type']}")
+            for key, value in data["series"]:
+                labels = list(zip(data["labels"], key))
+                if data["type"] != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(data["buckets"] + ["+Inf"], value["counts"]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _number(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    async def exposition(self) -> str:
+        """Текст для /metrics; чтение файлов других воркеров — вне event loop"""
+        live = self.snapshot()
+        return await asyncio.get_running_loop().run_in_executor(None, self._render, live)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value))
+
+
+metrics = MetricsRegistry(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+
+# Общие метрики, которые пишутся из нескольких модулей
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route", "status")
+)
+db_pool_wait = metrics.histogram("db_pool_checkout_wait_seconds", "Ожидание свободного соединения в пуле")
+db_query_duration = metrics.histogram("db_query_duration_seconds", "Время SQL-запроса", ("statement", "table"))
+password_hash_duration = metrics.histogram("password_hash_seconds", "Время bcrypt в пуле потоков", ("op",))
+ledger_appended = metrics.counter("ledger_appended_transactions_total", "Записано транзакций в леджер")
+ledger_batch_duration = metrics.histogram("ledger_append_batch_seconds", "Запись одной пачки транзакций леджера")
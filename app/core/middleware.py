@@ -1,27 +1,192 @@
+import re
 import time
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+import uuid
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from app.core.logging import request_id_var, user_id_var
+from app.core.metrics import http_request_duration
+from app.core.uploads import UPLOAD_KINDS
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        # Базовая защита
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+# Чистые ASGI-мидлвари: без BaseHTTPMiddleware (лишняя задача и обертка потока на каждый запрос,
+# ломает StreamingResponse и background tasks). Только дописываем заголовки в http.response.start.
 
-        # --- ВРЕМЕННО ОТКЛЮЧАЕМ CSP ---
-        # response.headers["Content-Security-Policy"] = "..."
-        # ------------------------------
+SECURITY_HEADERS = [
+    # Базовая защита
+    ("X-Content-Type-Options", "nosniff"),
+    ("X-Frame-Options", "DENY"),
+    ("Strict-Transport-Security", "max-age=31536000; includeSubDomains"),
+    # --- ВРЕМЕННО ОТКЛЮЧАЕМ CSP ---
+    # ("Content-Security-Policy", "..."),
+    # ------------------------------
+]
 
-        return response
 
+class SecurityHeadersMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-class ProcessTimeMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        response.headers["X-Process-Time"] = str(process_time)
-        return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                for name, value in SECURITY_HEADERS:
+                    headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class ProcessTimeMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+
+        async def send_with_time(message: Message):
+            if message["type"] == "http.response.start":
+                # Время до начала ответа (для стриминга — без времени отдачи тела)
+                process_time = time.perf_counter() - start_time
+                MutableHeaders(scope=message)["X-Process-Time"] = str(process_time)
+            await send(message)
+
+        await self.app(scope, receive, send_with_time)
+
+
+class MetricsMiddleware:
+    """Гистограмма времени запросов по шаблону маршрута (а не по сырому пути — иначе метки не ограничены)"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Роутер FastAPI кладет найденный маршрут в scope, Mount (/static) — свой префикс в root_path
+            route = getattr(scope.get("route"), "path", None) or scope.get("root_path") or "unmatched"
+            http_request_duration.observe(
+                time.perf_counter() - start_time,
+                scope["method"],
+                route,
+                str(status_code),
+            )
+
+
+# Входящий X-Request-ID от прокси принимаем, только если он похож на идентификатор
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestContextMiddleware:
+    """Проставляет request_id (и сбрасывает user_id) для логов запроса, возвращает X-Request-ID"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        request_id = incoming if _REQUEST_ID.match(incoming) else uuid.uuid4().hex
+
+        async def send_with_request_id(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
+
+        request_token = request_id_var.set(request_id)
+        user_token = user_id_var.set(None)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(request_token)
+            user_id_var.reset(user_token)
+
+
+# Поля формы и границы multipart поверх самого файла
+MULTIPART_OVERHEAD = 1024 * 1024
+
+
+class UploadLimitMiddleware:
+    """
+    Режет multipart-тело больше самого крупного лимита UPLOAD_KINDS до того, как Starlette разберет его
+    во временный файл: по Content-Length — сразу, без него (chunked) — по мере чтения.
+    Точный лимит по типу загрузки по-прежнему проверяет save_upload.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.max_body = max(rules["max_bytes"] for rules in UPLOAD_KINDS.values()) + MULTIPART_OVERHEAD
+
+    def _reject(self) -> JSONResponse:
+        return JSONResponse(
+            {"detail": f"Файл больше {(self.max_body - MULTIPART_OVERHEAD) // (1024 * 1024)} МБ"}, status_code=413
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        headers = dict(scope["headers"]) if scope["type"] == "http" else {}
+        if not headers.get(b"content-type", b"").lower().startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        length = headers.get(b"content-length")
+        if length is not None and (not length.isdigit() or int(length) > self.max_body):
+            await self._reject()(scope, receive, send)
+            return
+
+        received = 0
+        started = rejected = False
+
+        async def send_tracked(message: Message):
+            nonlocal started
+            if rejected:
+                return  # Ответ 413 уже отдан, ответ приложения на оборванное тело выбрасываем
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        async def receive_limited() -> Message:
+            # Исключение отсюда до нас не дойдет: FastAPI превращает любую ошибку разбора тела в 400.
+            # Поэтому 413 отдаем сами, а приложению сообщаем, что клиент отключился
+            nonlocal received, started, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body and not started:
+                    await self._reject()(scope, receive, send)
+                    started = rejected = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        try:
+            await self.app(scope, receive_limited, send_tracked)
+        except Exception:
+            if not rejected:
+                raise
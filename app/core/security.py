@@ -1,12 +1,42 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Union, Any
+from fastapi import HTTPException
 from jose import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
+from app.core.metrics import password_hash_duration
 
 # Настройка хеширования (bcrypt)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt отпускает GIL, поэтому хватает потоков. Пул ограничен, чтобы всплеск логинов не съел все ядра,
+# а семафор ограничивает очередь ожидающих: лишние запросы получают 503, а не висят минутами.
+_password_pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_password_slots = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_MAX_PENDING)
+
+
+async def _run_password_op(func, *args):
+    try:
+        await asyncio.wait_for(_password_slots.acquire(), timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, повторите попытку позже")
+    try:
+        result, elapsed = await asyncio.get_running_loop().run_in_executor(_password_pool, _timed, func, *args)
+    finally:
+        _password_slots.release()
+    password_hash_duration.observe(elapsed, func.__name__)
+    return result
+
+
+def _timed(func, *args):
+    # Время самого bcrypt, без ожидания в очереди пула; метрику пишем уже в event loop
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Проверяет, совпадает ли введенный пароль с хешем в БД"""
@@ -18,6 +48,16 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """То же, что verify_password, но не блокирует event loop"""
+    return await _run_password_op(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """То же, что get_password_hash, но не блокирует event loop"""
+    return await _run_password_op(get_password_hash, password)
+
+
 def create_access_token(subject: Union[str, Any], expires_delta: timedelta = None) -> str:
     """Создает JWT токен (цифровой пропуск)"""
     if expires_delta:
@@ -0,0 +1,102 @@
+"""
+Раздача загрузок (/static).
+
+- Файлы из хранилища blobs называются по SHA-256 и никогда не меняются: отдаем их с
+  Cache-Control immutable на год и сильным ETag из самого хеша.
+- Range/206 для больших PDF и 304 по If-None-Match делает FileResponse из Starlette.
+- Если рядом лежит предсжатая копия (file.br / file.gz) и клиент ее принимает — отдаем ее.
+- STATIC_OFFLOAD=x-accel|x-sendfile: воркер только проверяет путь и ставит заголовок,
+  а байты отдает фронтовой прокси (nginx internal location / Apache mod_xsendfile):
+
+      location /_uploads/ { internal; alias /app/uploads/; }
+"""
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Dict
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Scope
+
+from app.core.config import settings
+
+CONTENT_HASHED = re.compile(r"^([0-9a-f]{64})\.")
+IMMUTABLE = "public, max-age=31536000, immutable"
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding -> {кодировка: q}; "gzip;q=0" означает отказ, а не согласие"""
+    accepted = {}
+    for item in header.split(","):
+        token, *params = [part.strip() for part in item.split(";")]
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[token.lower()] = q
+    return accepted
+
+
+def accepts(accepted: Dict[str, float], encoding: str) -> bool:
+    return accepted.get(encoding, accepted.get("*", 0.0)) > 0
+
+
+class UploadStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        path = Path(full_path)
+        relative = path.resolve().relative_to(Path(self.directory).resolve())
+        if any(part.startswith(".") for part in relative.parts):
+            return Response(status_code=404)  # uploads/.tmp и прочие служебные файлы наружу не отдаем
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+        headers = {"Cache-Control": f"public, max-age={settings.STATIC_MAX_AGE}"}
+        hashed = CONTENT_HASHED.match(path.name)
+        if hashed:
+            headers["Cache-Control"] = IMMUTABLE
+            # Производные (<sha>.thumb.webp) — другие байты, поэтому в ETag идет и имя варианта
+            headers["ETag"] = f'"{hashed.group(1)}{path.name[64:].replace(".", "-")}"'
+
+        if settings.STATIC_OFFLOAD != "none":
+            if settings.STATIC_OFFLOAD == "x-accel":
+                headers["X-Accel-Redirect"] = settings.STATIC_ACCEL_PREFIX.rstrip("/") + "/" + relative.as_posix()
+            else:
+                headers["X-Sendfile"] = str(path.resolve())
+            return Response(status_code=status_code, headers=headers, media_type=media_type)
+
+        variants = [
+            (encoding, path.with_name(path.name + suffix)) for encoding, suffix in PRECOMPRESSED
+            if path.with_name(path.name + suffix).is_file()
+        ]
+        if variants:
+            # Ответ по этому URL зависит от Accept-Encoding — и сжатый, и исходный, иначе общий кэш
+            # с immutable раздаст всем тот вариант, который попал к нему первым
+            headers["Vary"] = "Accept-Encoding"
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        for encoding, compressed in variants:
+            if accepts(accepted, encoding):
+                headers["Content-Encoding"] = encoding
+                if "ETag" in headers:
+                    headers["ETag"] = headers["ETag"][:-1] + f'-{encoding}"'
+                path, stat_result = compressed, None
+                break
+
+        response = FileResponse(
+            path, status_code=status_code, stat_result=stat_result, headers=headers, media_type=media_type
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return Response(status_code=304, headers={
+                name: value for name, value in response.headers.items()
+                if name in ("cache-control", "etag", "last-modified", "vary", "content-location", "expires", "date")
+            })
+        return response
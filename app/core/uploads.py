@@ -0,0 +1,108 @@
+"""
+Общий прием загружаемых файлов.
+
+Файл читается чанками и пишется во временный файл рядом с местом назначения (запись — в пуле потоков,
+event loop не блокируется). За тот же проход проверяются сигнатура по первому чанку, лимит размера
+и считается SHA-256. В конце файл атомарно переименовывается на место.
+"""
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+CHUNK_SIZE = 64 * 1024
+UPLOAD_ROOT = Path("uploads")
+TMP_DIR = UPLOAD_ROOT / ".tmp"  # Та же ФС, что и у итоговых файлов, иначе replace не атомарен
+
+# Сигнатуры безопасных файлов (Hex заголовки)
+ALLOWED_MAGIC_NUMBERS = {
+    b'\xFF\xD8\xFF': "jpg",  # JPEG
+    b'\x89\x50\x4E\x47': "png",  # PNG
+    b'\x25\x50\x44\x46': "pdf"  # PDF
+}
+
+# Что разрешено и сколько весит максимум — по типу загрузки
+UPLOAD_KINDS: Dict[str, dict] = {
+    "proof": {"types": {"jpg", "png", "pdf"}, "max_bytes": settings.UPLOAD_MAX_PROOF_BYTES},
+    "achievement": {"types": {"jpg", "png", "pdf"}, "max_bytes": settings.UPLOAD_MAX_PROOF_BYTES},
+    "post_image": {"types": {"jpg", "png"}, "max_bytes": settings.UPLOAD_MAX_IMAGE_BYTES},
+}
+
+
+@dataclass
+class StoredFile:
+    path: Path
+    original_name: str
+    file_type: str  # jpg / png / pdf — по сигнатуре, а не по расширению
+    size: int
+    sha256: str
+
+
+def detect_file_type(header: bytes) -> Optional[str]:
+    """Реальный тип файла по первым байтам"""
+    for magic, ext in ALLOWED_MAGIC_NUMBERS.items():
+        if header.startswith(magic):
+            return ext
+    return None
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Имя от клиента без каталогов (../../ и т.п.)"""
+    return os.path.basename((filename or "").replace("\\", "/")) or "file"
+
+
+async def save_upload(file: UploadFile, kind: str, dest: Union[Path, Callable[[str, str], Path]]) -> StoredFile:
+    """
+    Сохраняет загрузку. dest — готовый путь или функция (sha256, тип файла) -> путь,
+    если имя зависит от содержимого. Ошибки формата и размера — HTTPException 400/413, файл не остается.
+    """
+    rules = UPLOAD_KINDS[kind]
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=TMP_DIR, prefix="upload-")
+    tmp = os.fdopen(fd, "wb")
+    digest = hashlib.sha256()
+    size = 0
+    file_type = None
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            if file_type is None:
+                file_type = detect_file_type(chunk)
+                if file_type not in rules["types"]:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Security Alert: Invalid file format. Only {', '.join(sorted(rules['types'])).upper()} allowed."
+                    )
+            size += len(chunk)
+            if size > rules["max_bytes"]:
+                raise HTTPException(status_code=413, detail=f"Файл больше {rules['max_bytes'] // (1024 * 1024)} МБ")
+            digest.update(chunk)
+            await run_in_threadpool(tmp.write, chunk)
+
+        if file_type is None:
+            raise HTTPException(status_code=400, detail="Пустой файл")
+        await run_in_threadpool(tmp.close)
+
+        sha256 = digest.hexdigest()
+        path = dest(sha256, file_type) if callable(dest) else dest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        await run_in_threadpool(os.replace, tmp_name, path)
+    except BaseException:
+        tmp.close()
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+    return StoredFile(
+        path=path,
+        original_name=safe_filename(file.filename),
+        file_type=file_type,
+        size=size,
+        sha256=sha256,
+    )
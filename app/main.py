@@ -1,34 +1,60 @@
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
-from fastapi.staticfiles import StaticFiles # <--- Импорт
 from app.modules.ledger.router import router as ledger_router
 from app.modules.posts.router import router as posts_router
 from app.core.config import settings
-from app.core.db import engine
+from app.core.db import engine, pool_stats
 from app.core.admin import setup_admin
 from app.core.limiter import limiter
 from app.modules.auth.router import router as auth_router
 from app.modules.ledger.router import router as ledger_router
 from app.modules.achievements.router import router as achievements_router
 from app.modules.posts.router import router as posts_router
-from app.core.middleware import SecurityHeadersMiddleware, ProcessTimeMiddleware
+from app.modules.leaderboard.router import router as leaderboard_router
+from app.modules.audit.router import router as audit_router
+from app.core.static import UploadStaticFiles
+from app.core.middleware import (
+    SecurityHeadersMiddleware, ProcessTimeMiddleware, MetricsMiddleware, RequestContextMiddleware,
+    UploadLimitMiddleware,
+)
 from app.core.logging import logger
+from app.core.metrics import metrics
+from app.modules.ledger.service import ledger_appender
+from app.modules.audit.service import audit_sink
+from app.modules.audit.partitions import maintain_partitions
+from app.modules.leaderboard.service import leaderboard
+from app.modules.ledger.merkle import merkle
+from app.modules.storage.derivatives import derivatives
 
 # ТУТ НУЖНО ИМПОРТИРОВАТЬ ВСЕ МОДЕЛИ ДЛЯ АДМИНКИ И МИГРАЦИЙ
 from app.modules.auth.models import User
 from app.modules.ledger.models import Transaction
 from app.modules.proofs.models import Proof
 from app.modules.audit.models import AuditLog
+from app.modules.storage.models import Blob
+from app.modules.archive.models import ArchiveSegment
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("🚀 System Starting... Security Protocols Active")
+    await maintain_partitions()
+    ledger_appender.start()
+    audit_sink.start()
+    metrics.start()
+    leaderboard.start()
+    merkle.start()
     yield
+    await merkle.stop()
+    await leaderboard.stop()
+    await metrics.stop()
+    await ledger_appender.stop()
+    await audit_sink.stop()
+    await derivatives.stop()
     logger.info("🛑 System Shutting Down...")
 
 app = FastAPI(
@@ -50,10 +76,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Request-ID", "Idempotent-Replayed"],
 )
 
+app.add_middleware(UploadLimitMiddleware)  # До разбора multipart: лишнее не спулится на диск
 app.add_middleware(SecurityHeadersMiddleware)
 app.add_middleware(ProcessTimeMiddleware)
+app.add_middleware(MetricsMiddleware)  # Добавленные последними — внешние: метрики меряют весь стек
+app.add_middleware(RequestContextMiddleware)  # request_id нужен логам всех слоев ниже
 
 # --- РОУТЕРЫ ---
 app.include_router(auth_router, prefix=f"{settings.API_V1_STR}/auth", tags=["Auth"])
@@ -62,8 +92,10 @@ app.include_router(ledger_router, prefix=f"{settings.API_V1_STR}/ledger", tags=[
 app.include_router(achievements_router, prefix=f"{settings.API_V1_STR}", tags=["Achievements"]) # <--- [2] ДОБАВЛЕНО
 
 app.include_router(posts_router, prefix=f"{settings.API_V1_STR}", tags=["Posts"])
+app.include_router(leaderboard_router, prefix=f"{settings.API_V1_STR}/leaderboard", tags=["Leaderboard"])
+app.include_router(audit_router, prefix=f"{settings.API_V1_STR}/audit", tags=["Audit"])
 
-app.mount("/static", StaticFiles(directory="uploads"), name="static")
+app.mount("/static", UploadStaticFiles(directory="uploads"), name="static")
 app.include_router(ledger_router, prefix=f"{settings.API_V1_STR}/ledger", tags=["Ledger"])
 app.include_router(posts_router, prefix=f"{settings.API_V1_STR}/posts", tags=["Posts"])
 @app.get("/", include_in_schema=False)
@@ -73,3 +105,11 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "ok", "system": "Kiibiki Secure Reward System"}
+
+@app.get("/health/db")
+async def health_db():
+    return pool_stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return PlainTextResponse(await metrics.exposition(), media_type="text/plain; version=0.0.4")
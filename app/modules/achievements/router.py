@@ -1,6 +1,7 @@
-import shutil
 import os
+from pathlib import Path
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from app.core.uploads import safe_filename, save_upload
 from app.modules.auth.dependencies import get_current_user
 from app.modules.auth.models import User
 
@@ -17,16 +18,17 @@ async def upload_achievement(
 ):
     try:
         # Генерируем уникальное имя
-        file_path = f"{UPLOAD_DIR}/{current_user.id}_{file.filename}"
+        file_path = Path(UPLOAD_DIR) / f"{current_user.id}_{safe_filename(file.filename)}"
 
-        # Сохраняем файл на диск
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Сохраняем файл на диск (потоково, с проверкой формата и размера)
+        stored = await save_upload(file, "achievement", file_path)
 
         return {
             "status": "success",
-            "filename": file.filename,
+            "filename": stored.original_name,
             "message": "Файл успешно загружен и отправлен на проверку"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка загрузки: {str(e)}")
@@ -0,0 +1,29 @@
+from typing import Optional
+from datetime import datetime
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field
+
+
+class ArchiveSegment(SQLModel, table=True):
+    """Файл с закрытым периодом таблицы: строки с id в [first_id, last_id] удалены из живой таблицы"""
+    __tablename__ = "archive_segments"
+    __table_args__ = (
+        Index("ix_archive_segments_table_last_id", "table_name", "last_id", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    table_name: str  # ledger_transactions или audit_logs
+    path: str  # Относительно ARCHIVE_DIR
+    first_id: int
+    last_id: int
+    first_at: datetime
+    last_at: datetime
+    record_count: int
+    size_bytes: int
+    sha256: str
+
+    # Только для леджера: стык цепочки с соседними сегментами и живой таблицей
+    first_prev_hash: Optional[str] = None
+    last_hash: Optional[str] = None
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
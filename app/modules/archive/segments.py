@@ -0,0 +1,135 @@
+"""
+Формат сегмента архива.
+
+    [MAGIC][блок 0][блок 1]...[индекс][футер]
+
+Блок — до block_records записей в JSON Lines, сжатых zlib, с crc32 для быстрой проверки при чтении.
+Индекс (JSON) разреженный: по строке на блок — диапазоны id и времени, смещение, длина, crc32
+и отсортированный список значений группирующего поля (для леджера — target_user_id), чтобы
+выборка по одному пользователю не распаковывала чужие блоки.
+Футер фиксированной длины: смещение и длина индекса, sha256 всего, что до футера, и MAGIC.
+
+Файл только читается через mmap: открыть сегмент — это прочитать футер и индекс, блок распаковывается по запросу.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+from bisect import bisect_right
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+MAGIC = b"KBSEG01\n"
+FOOTER = struct.Struct("<QI32s8s")  # index_offset, index_length, sha256, MAGIC
+
+
+class SegmentError(Exception):
+    pass
+
+
+class SegmentWriter:
+    """Пишет сегмент во временный файл; на close() — fsync и атомарное переименование"""
+
+    def __init__(self, path: Path, id_key: str, time_key: str, group_key: Optional[str] = None,
+                 block_records: int = 512):
+        self.path = path
+        self._tmp = path.with_name(f".{path.name}.tmp")
+        self._id_key, self._time_key, self._group_key = id_key, time_key, group_key
+        self._block_records = block_records
+        self._pending: List[dict] = []
+        self._index: List[dict] = []
+        self._digest = hashlib.sha256()
+        self._offset = 0
+        self.count = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self._tmp, "wb")
+        self._write(MAGIC)
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._digest.update(data)
+        self._offset += len(data)
+
+    def add_many(self, records: Iterable[dict]):
+        for record in records:
+            self._pending.append(record)
+            if len(self._pending) >= self._block_records:
+                self._flush_block()
+
+    def _flush_block(self):
+        if not self._pending:
+            return
+        records = self._pending
+        payload = zlib.compress("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records).encode(), 6)
+        entry = {
+            "first_id": records[0][self._id_key],
+            "last_id": records[-1][self._id_key],
+            "first_time": records[0][self._time_key],
+            "last_time": records[-1][self._time_key],
+            "count": len(records),
+            "offset": self._offset,
+            "length": len(payload),
+            "crc32": zlib.crc32(payload),
+        }
+        if self._group_key:
+            entry["groups"] = sorted({r[self._group_key] for r in records if r[self._group_key] is not None})
+        self._write(payload)
+        self._index.append(entry)
+        self.count += len(records)
+        self._pending = []
+
+    def close(self) -> str:
+        """Дописывает индекс и футер; возвращает sha256 сегмента"""
+        self._flush_block()
+        index = json.dumps(self._index, separators=(",", ":")).encode()
+        index_offset = self._offset
+        self._write(index)
+        digest = self._digest.digest()
+        self._file.write(FOOTER.pack(index_offset, len(index), digest, MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp, self.path)
+        return digest.hex()
+
+    def abort(self):
+        self._file.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+class SegmentReader:
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < len(MAGIC) + FOOTER.size or self._mm[:len(MAGIC)] != MAGIC:
+            raise SegmentError(f"{path}: не сегмент архива")
+        index_offset, index_length, self.sha256, magic = FOOTER.unpack(self._mm[-FOOTER.size:])
+        if magic != MAGIC:
+            raise SegmentError(f"{path}: поврежден футер")
+        self._data_end = index_offset + index_length
+        self.index: List[dict] = json.loads(self._mm[index_offset:self._data_end])
+        self._first_ids = [entry["first_id"] for entry in self.index]
+
+    def verify(self) -> bool:
+        """Полная проверка sha256 (читает весь файл)"""
+        return hashlib.sha256(self._mm[:self._data_end]).digest() == self.sha256
+
+    def read_block(self, number: int) -> List[dict]:
+        entry = self.index[number]
+        payload = self._mm[entry["offset"]:entry["offset"] + entry["length"]]
+        if zlib.crc32(payload) != entry["crc32"]:
+            raise SegmentError(f"{self.path}: блок {number} поврежден")
+        return [json.loads(line) for line in zlib.decompress(payload).splitlines()]
+
+    def block_for(self, record_id: int) -> Optional[int]:
+        """Номер блока, в диапазон которого попадает id (бинарный поиск по разреженному индексу)"""
+        number = bisect_right(self._first_ids, record_id) - 1
+        if number < 0 or record_id > self.index[number]["last_id"]:
+            return None
+        return number
+
+    def close(self):
+        self._mm.close()
@@ -0,0 +1,354 @@
+"""
+Архивация закрытых периодов.
+
+ledger_transactions и audit_logs только растут. Закрытый период (например, прошлый семестр)
+выгружается в сегмент (см. segments.py) в ARCHIVE_DIR и удаляется из живой таблицы,
+так что ее размер и индексы остаются ограниченными.
+
+Для леджера архивируется только то, что уже закрыто блоком Меркла и покрыто снимком балансов,
+а стык цепочки хранится в archive_segments: prev_hash первой живой записи = last_hash последнего сегмента.
+История, проверка цепочки и доказательства включения читают сегменты и живую таблицу как одно целое.
+
+id журнала аудита не упорядочены по времени (пачки audit_sink и досылка spill-файла пишут старые
+timestamp с новыми id), поэтому аудит архивируется по timestamp < before, а удаляются ровно те id,
+что попали в сегмент; first_id/last_id его сегментов — min/max, а не сплошной диапазон.
+
+ARCHIVE_DIR должен быть общим для CLI и всех воркеров API (один хост или общий том) — они читают
+сегменты по путям из archive_segments. Относительный путь считается от корня проекта, а не от текущего каталога.
+
+    python -m app.modules.archive.service ledger --before 2026-02-01
+    python -m app.modules.archive.service audit --before 2026-02-01
+    python -m app.modules.archive.service verify          # sha256 всех сегментов
+"""
+import argparse
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.db import async_session_maker, engine
+from app.core.logging import logger
+from app.modules.archive.models import ArchiveSegment
+from app.modules.archive.segments import SegmentReader, SegmentWriter
+from app.modules.audit.models import AuditLog
+from app.modules.ledger.balances import snapshot_epoch, take_snapshot
+from app.modules.ledger.models import MerkleBlock, Transaction
+from app.modules.ledger.service import lock_chain
+
+ARCHIVE_DIR = Path(settings.ARCHIVE_DIR)
+if not ARCHIVE_DIR.is_absolute():
+    ARCHIVE_DIR = Path(__file__).resolve().parents[3] / ARCHIVE_DIR
+LEDGER_TABLE = Transaction.__tablename__
+AUDIT_TABLE = AuditLog.__tablename__
+READ_PARTITION = 5000
+OPEN_SEGMENTS = 32  # Сколько сегментов держим открытыми (mmap)
+
+_readers: "OrderedDict[str, SegmentReader]" = OrderedDict()
+
+
+def open_segment(segment: ArchiveSegment) -> SegmentReader:
+    reader = _readers.get(segment.path)
+    if reader is None:
+        reader = _readers[segment.path] = SegmentReader(ARCHIVE_DIR / segment.path)
+        while len(_readers) > OPEN_SEGMENTS:
+            _readers.popitem(last=False)[1].close()
+    _readers.move_to_end(segment.path)
+    return reader
+
+
+def _to_record(row) -> dict:
+    record = row.model_dump()
+    for key, value in record.items():
+        if isinstance(value, datetime):
+            record[key] = value.isoformat()
+    return record
+
+
+def _to_transaction(record: dict) -> Transaction:
+    # Table-модели SQLModel не валидируют вход, поэтому дату разбираем сами; str() дает тот же вид, что был в хеше
+    return Transaction(**{**record, "created_at": datetime.fromisoformat(record["created_at"])})
+
+
+async def list_segments(session: AsyncSession, table_name: str) -> List[ArchiveSegment]:
+    result = await session.exec(
+        select(ArchiveSegment).where(ArchiveSegment.table_name == table_name).order_by(ArchiveSegment.first_id)
+    )
+    return list(result.all())
+
+
+async def archived_upto(session: AsyncSession, table_name: str) -> int:
+    """Последний id, вынесенный в архив (0 — архива нет)"""
+    result = await session.exec(
+        select(func.max(ArchiveSegment.last_id)).where(ArchiveSegment.table_name == table_name)
+    )
+    return result.first() or 0
+
+
+# --- Чтение леджера из архива ---
+
+async def find_archived_transaction(session: AsyncSession, tx_id: int) -> Optional[Transaction]:
+    for segment in await list_segments(session, LEDGER_TABLE):
+        if segment.first_id <= tx_id <= segment.last_id:
+            reader = open_segment(segment)
+            number = reader.block_for(tx_id)
+            if number is None:
+                return None
+            records = await run_in_threadpool(reader.read_block, number)
+            return next((_to_transaction(r) for r in records if r["id"] == tx_id), None)
+    return None
+
+
+async def archived_range(session: AsyncSession, first_id: int, last_id: int) -> List[Transaction]:
+    """Транзакции архива с id в [first_id, last_id] по возрастанию id"""
+    transactions = []
+    async for chunk in iter_archived_transactions(session, first_id - 1, last_id):
+        transactions.extend(chunk)
+    return transactions
+
+
+async def iter_archived_transactions(
+        session: AsyncSession, after_id: int, upto_id: Optional[int] = None
+) -> AsyncIterator[List[Transaction]]:
+    """Блоками по возрастанию id: транзакции архива с after_id < id <= upto_id"""
+    for segment in await list_segments(session, LEDGER_TABLE):
+        if segment.last_id <= after_id or (upto_id is not None and segment.first_id > upto_id):
+            continue
+        reader = open_segment(segment)
+        for number, entry in enumerate(reader.index):
+            if entry["last_id"] <= after_id or (upto_id is not None and entry["first_id"] > upto_id):
+                continue
+            records = await run_in_threadpool(reader.read_block, number)
+            yield [
+                _to_transaction(r) for r in records
+                if r["id"] > after_id and (upto_id is None or r["id"] <= upto_id)
+            ]
+
+
+async def archived_history(
+        session: AsyncSession, user_id: int, before: Optional[Tuple[datetime, int]], limit: int
+) -> List[Transaction]:
+    """Продолжение истории пользователя в архиве: (created_at, id) < before, от новых к старым"""
+    found: List[Transaction] = []
+    for segment in reversed(await list_segments(session, LEDGER_TABLE)):
+        if before and segment.first_at > before[0]:
+            continue
+        reader = open_segment(segment)
+        for number in range(len(reader.index) - 1, -1, -1):
+            entry = reader.index[number]
+            if user_id not in entry.get("groups", ()) or (before and entry["first_time"] > before[0].isoformat()):
+                continue
+            records = await run_in_threadpool(reader.read_block, number)
+            for record in records:
+                if record["target_user_id"] != user_id:
+                    continue
+                tx = _to_transaction(record)
+                if before is None or (tx.created_at, tx.id) < before:
+                    found.append(tx)
+            if len(found) >= limit:
+                break
+        if len(found) >= limit:
+            break
+    found.sort(key=lambda tx: (tx.created_at, tx.id), reverse=True)
+    return found[:limit]
+
+
+# --- Архивация ---
+
+def _closed_before(before: datetime) -> datetime:
+    """Текущий месяц и неделя нужны рейтингу и снимкам живыми — архивировать можно только раньше них"""
+    now = datetime.utcnow()
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    week_start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    limit = min(month_start, week_start)
+    if before > limit:
+        raise ValueError(f"Период не закрыт: архивировать можно только до {limit:%Y-%m-%d}")
+    return before
+
+
+async def _segment_count(session: AsyncSession, table_name: str) -> int:
+    result = await session.exec(select(func.count(ArchiveSegment.id)).where(ArchiveSegment.table_name == table_name))
+    return result.first() or 0
+
+
+async def _write_segment(session: AsyncSession, model, path: Path, conditions: list,
+                         time_key: str, group_key: Optional[str]):
+    """Пишет подходящие под conditions строки в сегмент по порядку id; возвращает писателя, sha256,
+    первую и последнюю строку, id всех записанных и границы их времени"""
+    if path.exists():
+        raise RuntimeError(f"{path}: сегмент уже существует")
+    writer = SegmentWriter(path, "id", time_key, group_key, settings.ARCHIVE_BLOCK_RECORDS)
+    first = last = None
+    ids: Set[int] = set()
+    first_at = last_at = None
+    try:
+        result = await session.stream(
+            select(model).where(*conditions).order_by(model.id)
+            .execution_options(yield_per=READ_PARTITION)
+        )
+        async for partition in result.scalars().partitions(READ_PARTITION):
+            first = first or partition[0]
+            last = partition[-1]
+            ids.update(row.id for row in partition)
+            times = [getattr(row, time_key) for row in partition]
+            first_at = min(times + ([first_at] if first_at else []))
+            last_at = max(times + ([last_at] if last_at else []))
+            await run_in_threadpool(writer.add_many, [_to_record(row) for row in partition])
+            session.expunge_all()
+        sha256 = await run_in_threadpool(writer.close)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer, sha256, first, last, ids, (first_at, last_at)
+
+
+async def _archive(table_name: str, model, time_column, before: datetime) -> Optional[ArchiveSegment]:
+    before = _closed_before(before)
+    is_ledger = table_name == LEDGER_TABLE
+    async with async_session_maker() as session:
+        if is_ledger:
+            await take_snapshot(session)  # Балансы по леджеру не должны зависеть от удаляемых строк
+
+        segments_before = await _segment_count(session, table_name)
+        if is_ledger:
+            # Леджер — сплошной диапазон id (after_id, cut]: цепочка идет по id.
+            # Только то, что уже под подписанным корнем Меркла и покрыто снимком балансов
+            after_id = await archived_upto(session, table_name)
+            # Срез по id, но не дальше первой записи с created_at >= before: created_at ставится при сборке
+            # звена, а не под блокировкой цепочки, поэтому на стыке периодов id и время могут не совпадать по порядку
+            first_open = (await session.exec(
+                select(func.min(model.id)).where(model.id > after_id, time_column >= before)
+            )).first()
+            if first_open is not None:
+                cut = first_open - 1
+            else:
+                cut = (await session.exec(select(func.max(model.id)).where(time_column < before))).first() or 0
+            sealed = (await session.exec(select(func.max(MerkleBlock.last_tx_id)))).first() or 0
+            cut = min(cut, sealed, await snapshot_epoch(session))
+            if cut <= after_id:
+                await session.commit()
+                return None
+            conditions = [model.id > after_id, model.id <= cut]
+            path = ARCHIVE_DIR / table_name / f"{after_id + 1:012d}-{cut:012d}.seg"
+        else:
+            # Аудит — все живые строки старше before, какими бы ни были их id
+            conditions = [time_column < before]
+            first_id, last_id = (await session.execute(select(func.min(model.id), func.max(model.id)).where(*conditions))).one()
+            if first_id is None:
+                await session.commit()
+                return None
+            path = ARCHIVE_DIR / table_name / f"{before:%Y%m%d}-{first_id:012d}-{last_id:012d}.seg"
+        await session.commit()
+
+        # Старые строки неизменяемы, поэтому файл пишется без блокировок
+        writer, sha256, first, last, ids, (first_at, last_at) = await _write_segment(
+            session, model, path, conditions,
+            "created_at" if is_ledger else "timestamp", "target_user_id" if is_ledger else None,
+        )
+        if first is None:
+            writer.path.unlink(missing_ok=True)
+            return None
+        reader = SegmentReader(writer.path)
+        try:
+            if not reader.verify() or sum(entry["count"] for entry in reader.index) != writer.count:
+                raise RuntimeError(f"{writer.path}: сегмент не прошел проверку после записи")
+        finally:
+            reader.close()
+
+        if is_ledger:
+            await lock_chain(session)
+        if await _segment_count(session, table_name) != segments_before:
+            writer.path.unlink(missing_ok=True)
+            raise RuntimeError("Архив этой таблицы параллельно обновил другой процесс")
+        segment = ArchiveSegment(
+            table_name=table_name,
+            path=str(writer.path.relative_to(ARCHIVE_DIR)),
+            first_id=first.id,
+            last_id=last.id,
+            first_at=first_at,
+            last_at=last_at,
+            record_count=writer.count,
+            size_bytes=writer.path.stat().st_size,
+            sha256=sha256,
+            first_prev_hash=first.prev_hash if is_ledger else None,
+            last_hash=last.current_hash if is_ledger else None,
+        )
+        session.add(segment)
+        if is_ledger:
+            await session.execute(delete(model).where(*conditions))
+        else:
+            # Ровно то, что записано: строки, пришедшие во время записи файла, остаются в таблице
+            ordered = sorted(ids)
+            for i in range(0, len(ordered), READ_PARTITION):
+                await session.execute(
+                    delete(model).where(time_column < before, model.id.in_(ordered[i:i + READ_PARTITION]))
+                )
+        await session.commit()
+        await session.refresh(segment)
+    logger.info(f"Archived {writer.count} rows of {table_name} into {segment.path}")
+    return segment
+
+
+async def archive_ledger(before: datetime) -> Optional[ArchiveSegment]:
+    return await _archive(LEDGER_TABLE, Transaction, Transaction.created_at, before)
+
+
+async def archive_audit(before: datetime) -> Optional[ArchiveSegment]:
+    return await _archive(AUDIT_TABLE, AuditLog, AuditLog.timestamp, before)
+
+
+async def verify_segments() -> List[str]:
+    """Проверяет sha256 и стыки цепочки всех сегментов; возвращает список проблем"""
+    problems = []
+    async with async_session_maker() as session:
+        for table_name in (LEDGER_TABLE, AUDIT_TABLE):
+            previous: Optional[ArchiveSegment] = None
+            for segment in await list_segments(session, table_name):
+                reader = open_segment(segment)
+                if reader.sha256.hex() != segment.sha256 or not await run_in_threadpool(reader.verify):
+                    problems.append(f"{segment.path}: sha256 не совпадает")
+                if previous and table_name == LEDGER_TABLE and segment.first_prev_hash != previous.last_hash:
+                    problems.append(f"{segment.path}: разрыв цепочки с {previous.path}")
+                previous = segment
+    return problems
+
+
+async def _main(args):
+    try:
+        if args.command == "verify":
+            problems = await verify_segments()
+            for problem in problems:
+                print(f"  {problem}")
+            print("ok" if not problems else "FAILED")
+            raise SystemExit(0 if not problems else 1)
+
+        before = datetime.fromisoformat(args.before)
+        archive = archive_ledger if args.command == "ledger" else archive_audit
+        segment = await archive(before)
+        if segment is None:
+            print("nothing to archive")
+        else:
+            print(f"{segment.path}: ids {segment.first_id}..{segment.last_id}, "
+                  f"{segment.record_count} rows, {segment.size_bytes} bytes")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архивация закрытых периодов леджера и журнала аудита")
+    parser.add_argument("command", choices=["ledger", "audit", "verify"])
+    parser.add_argument("--before", help="Дата (UTC), раньше которой строки уходят в архив, например 2026-02-01")
+    args = parser.parse_args()
+    if args.command != "verify" and not args.before:
+        parser.error("--before обязателен для ledger и audit")
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
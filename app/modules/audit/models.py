@@ -1,10 +1,21 @@
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 from datetime import datetime
 from typing import Optional
 
 
 class AuditLog(SQLModel, table=True):
+    """
+    В Postgres таблица секционирована по месяцам (RANGE по timestamp, см. partitions.py),
+    и первичный ключ там — (id, timestamp). Для ORM достаточно id: он уникален по общей последовательности.
+    """
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        # Расследования почти всегда "что делал этот пользователь" или "все события типа X" за период
+        Index("ix_audit_logs_action_timestamp", "action", "timestamp"),
+        Index("ix_audit_logs_actor_timestamp", "actor_id", "timestamp"),
+        Index("ix_audit_logs_timestamp", "timestamp"),  # Лента "последние события" без фильтров
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     actor_id: Optional[int] = Field(default=None)  # Кто сделал (может быть Null при неудачном входе)
@@ -0,0 +1,163 @@
+"""
+Месячные секции audit_logs (только Postgres).
+
+Таблица секционирована RANGE по timestamp: audit_logs_pYYYYMM на каждый месяц и audit_logs_default
+для всего, что не попало ни в один диапазон (например, spill-файл, досланный после долгого простоя).
+Запрос с условием на timestamp читает только секции своего окна (partition pruning), а индексы
+(action, timestamp), (actor_id, timestamp) и триграммный по details у каждой секции свои и небольшие.
+
+Секции создаются заранее на AUDIT_PARTITION_MONTHS_AHEAD месяцев — при старте приложения и по cron:
+    python -m app.modules.audit.partitions ensure
+    python -m app.modules.audit.partitions list
+    python -m app.modules.audit.partitions prune    # снять пустые прошедшие секции (после архивации)
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.db import async_session_maker, engine
+from app.core.logging import logger
+from app.modules.audit.models import AuditLog
+
+PARENT = AuditLog.__tablename__
+DEFAULT_PARTITION = f"{PARENT}_default"
+
+# Ключ advisory-lock'а обслуживания секций: воркеры стартуют одновременно
+PARTITION_LOCK_KEY = 0x4B11A0D1
+
+
+def month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT}_p{month:%Y%m}"
+
+
+async def is_partitioned(session: AsyncSession) -> bool:
+    if session.bind.dialect.name != "postgresql":
+        return False
+    result = await session.execute(
+        text("SELECT 1 FROM pg_class WHERE relname = :name AND relkind = 'p'"), {"name": PARENT}
+    )
+    return result.first() is not None
+
+
+async def list_partitions(session: AsyncSession) -> List[Tuple[str, str]]:
+    """(имя секции, границы) по порядку имен"""
+    result = await session.execute(text("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :name
+        ORDER BY child.relname
+    """), {"name": PARENT})
+    return [(name, bounds) for name, bounds in result.all()]
+
+
+async def _create_partition(session: AsyncSession, month: datetime):
+    """Создает секцию месяца; строки этого месяца, успевшие попасть в секцию по умолчанию, переезжают в нее"""
+    name, end = partition_name(month), next_month(month)
+    await session.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)"))
+    # До ATTACH строку этого месяца еще можно вставить в default — тогда ATTACH упадет на ее проверке.
+    # Блокировка держит вставки (audit_sink) до коммита; чтение журнала она не останавливает
+    await session.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE"))
+    await session.execute(
+        text(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE "timestamp" >= :start AND "timestamp" < :end RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """),
+        {"start": month, "end": end},
+    )
+    # Индексы родителя ATTACH создает в секции сам
+    await session.execute(text(
+        f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    ))
+
+
+async def ensure_partitions(session: AsyncSession, months_ahead: int) -> List[str]:
+    """Создает недостающие секции с текущего месяца на months_ahead вперед; возвращает имена созданных"""
+    if not await is_partitioned(session):
+        return []
+    await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    existing = {name for name, _ in await list_partitions(session)}
+    created = []
+    month = month_start(datetime.utcnow())
+    for _ in range(months_ahead + 1):
+        if partition_name(month) not in existing:
+            await _create_partition(session, month)
+            created.append(partition_name(month))
+        month = next_month(month)
+    await session.commit()
+    return created
+
+
+async def prune_partitions(session: AsyncSession) -> List[str]:
+    """Отсоединяет и удаляет пустые секции прошедших месяцев (их строки уже ушли в архив)"""
+    if not await is_partitioned(session):
+        return []
+    await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    current = partition_name(month_start(datetime.utcnow()))
+    dropped = []
+    for name, _ in await list_partitions(session):
+        if name == DEFAULT_PARTITION or name >= current:
+            continue
+        if (await session.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})"))).scalar():
+            continue
+        await session.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        await session.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    await session.commit()
+    return dropped
+
+
+async def maintain_partitions():
+    """Вызывается при старте: без новой секции записи просто лягут в default, поэтому ошибка не роняет приложение"""
+    try:
+        async with async_session_maker() as session:
+            created = await ensure_partitions(session, settings.AUDIT_PARTITION_MONTHS_AHEAD)
+        if created:
+            logger.info(f"Audit partitions created: {', '.join(created)}")
+    except Exception as e:
+        logger.error(f"Audit partition maintenance failed: {e}")
+
+
+async def _main(args):
+    try:
+        async with async_session_maker() as session:
+            if args.command == "ensure":
+                names = await ensure_partitions(session, args.ahead)
+            elif args.command == "prune":
+                names = await prune_partitions(session)
+            else:
+                for name, bounds in await list_partitions(session):
+                    print(f"{name}: {bounds}")
+                return
+        print(f"{args.command}: {', '.join(names) or 'nothing to do'}")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Месячные секции журнала аудита")
+    parser.add_argument("command", choices=["ensure", "list", "prune"])
+    parser.add_argument("--ahead", type=int, default=settings.AUDIT_PARTITION_MONTHS_AHEAD,
+                        help="На сколько месяцев вперед создавать секции")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import tuple_
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.core.config import settings
+from app.core.db import get_session
+from app.core.pagination import decode_cursor, encode_cursor
+from app.modules.audit.models import AuditLog
+from app.modules.audit.service import limit_statement_time, search_conditions
+from app.modules.auth.dependencies import get_current_user
+from app.modules.auth.models import User
+
+router = APIRouter()
+
+QUERY_CANCELED = "57014"  # SQLSTATE отмены по statement_timeout
+
+
+def _utc(moment: Optional[datetime]) -> Optional[datetime]:
+    # timestamp в журнале — наивное UTC
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+@router.get("/search", response_model=List[AuditLog])
+async def search_audit_log(
+        response: Response,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        action: Optional[str] = None,
+        actor_id: Optional[int] = None,
+        q: Optional[str] = Query(default=None, min_length=3, max_length=200),
+        limit: int = Query(default=100, ge=1, le=500),
+        cursor: Optional[str] = None,
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_session)
+):
+    """
+    Поиск по журналу безопасности в окне [since, until) — по умолчанию последние AUDIT_SEARCH_DEFAULT_DAYS дней.
+    q — подстрока в details (от 3 символов, чтобы работал триграммный индекс). От новых к старым, курсор — в X-Next-Cursor.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Нет прав")
+
+    until = _utc(until) or datetime.utcnow()
+    since = _utc(since) or until - timedelta(days=settings.AUDIT_SEARCH_DEFAULT_DAYS)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since должен быть раньше until")
+    if until - since > timedelta(days=settings.AUDIT_SEARCH_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Окно поиска — не больше {settings.AUDIT_SEARCH_MAX_DAYS} дней")
+
+    query = select(AuditLog).where(*search_conditions(since, until, action, actor_id, q))
+    if cursor:
+        query = query.where(tuple_(AuditLog.timestamp, AuditLog.id) < tuple_(*decode_cursor(cursor)))
+    query = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit + 1)
+
+    await limit_statement_time(session, settings.AUDIT_SEARCH_TIMEOUT_MS)
+    try:
+        result = await session.execute(query)
+    except DBAPIError as e:
+        if getattr(e.orig, "sqlstate", None) != QUERY_CANCELED:
+            raise
+        raise HTTPException(status_code=503, detail="Поиск не уложился во время: сузьте окно или добавьте фильтры")
+    page = result.scalars().all()
+
+    if len(page) > limit:
+        page = page[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(page[-1].timestamp, page[-1].id)
+    return page
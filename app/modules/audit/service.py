@@ -1,18 +1,244 @@
+import asyncio
+import fcntl
+import json
+import os
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import insert, or_, text
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.db import async_session_maker
+from app.core.logging import logger
+from app.core.metrics import metrics
 from app.modules.audit.models import AuditLog
 
-async def log_action(session: AsyncSession, action: str, details: str, actor_id: int = None):
+
+class AuditSink:
     """
-    Записывает критическое действие в базу.
-    Не блокирует основной поток (fire and forget в идеале, но пока await).
+    Журнал безопасности пишется фоном: события копятся в ограниченной очереди
+    и сбрасываются в БД многострочным INSERT по размеру пачки или по таймеру.
+    Если БД недоступна (или очередь переполнена), события дописываются в локальный spill-файл
+    и при следующем старте досылаются в таблицу.
+
+    У каждого процесса свой файл (audit_spill.<pid>.jsonl): воркеры uvicorn не пишут в один файл.
+    Досылает один воркер под flock: свой файл, файлы завершившихся процессов и общий файл старого формата.
+    Файлы живых воркеров не трогаются — их дошлют сами владельцы при следующем старте или после их смерти.
     """
+
+    def __init__(
+            self,
+            session_factory: sessionmaker,
+            max_queue: int,
+            batch_size: int,
+            flush_interval: float,
+            spill_path: str
+    ):
+        self._session_factory = session_factory
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._spill_path = spill_path
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="audit-sink")
+
+    async def stop(self):
+        """Сбрасывает всё, что накопилось, и останавливает фоновую задачу"""
+        if self._task is None:
+            return
+        await self._queue.put(None)  # Сигнал остановки встает в очередь последним
+        await self._task
+        self._task = None
+
+    def submit(self, event: dict):
+        self.start()
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Запрос не ждет журнал: лишнее сразу уходит на диск
+            self._spill([event])
+
+    async def _run(self):
+        try:
+            await self._replay_spill()
+        except Exception as e:
+            # Файлы остаются на диске и дочитаются при следующем старте; журнал должен писаться и сейчас
+            logger.error(f"Audit spill replay failed: {e}")
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = []
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch.append(item)
+
+            deadline = loop.time() + self._flush_interval
+            while len(batch) < self._batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[dict]):
+        try:
+            async with self._session_factory() as session:
+                await session.execute(insert(AuditLog), batch)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"CRITICAL: FAILED TO WRITE AUDIT LOG ({len(batch)} events): {e}")
+            self._spill(batch)
+
+    def _own_spill_path(self) -> str:
+        root, ext = os.path.splitext(self._spill_path)
+        return f"{root}.{os.getpid()}{ext}"
+
+    def _spill(self, events: List[dict]):
+        with open(self._own_spill_path(), "a", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps({**event, "timestamp": event["timestamp"].isoformat()}, ensure_ascii=False) + "\n")
+
+    def _orphaned_spills(self) -> List[str]:
+        """Spill-файлы, в которые никто больше не пишет: свой, от завершившихся процессов и без pid (старый формат)"""
+        directory = os.path.dirname(self._spill_path) or "."
+        root, ext = os.path.splitext(os.path.basename(self._spill_path))
+        pattern = re.compile(rf"{re.escape(root)}(?:\.(\d+))?{re.escape(ext)}(?:\.replay)?")
+        paths = []
+        for name in sorted(os.listdir(directory)):
+            match = pattern.fullmatch(name)
+            if match is None:
+                continue
+            pid = match.group(1)
+            if pid is not None and int(pid) != os.getpid() and _process_alive(int(pid)):
+                continue
+            paths.append(os.path.join(directory, name))
+        return paths
+
+    async def _replay_spill(self):
+        with open(f"{self._spill_path}.lock", "a") as lock:
+            try:
+                # Держится до конца реплея (снимается при закрытии файла)
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # Сейчас досылает другой воркер
+            paths = self._orphaned_spills()
+            # Остатки прерванных прошлых реплеев — первыми, иначе os.replace ниже затер бы их.
+            # Уже досланные из них пачки попадут в журнал второй раз: дубль лучше потери
+            for path in paths:
+                if path.endswith(".replay"):
+                    await self._replay_file(path)
+            for path in paths:
+                if not path.endswith(".replay"):
+                    os.replace(path, f"{path}.replay")
+                    await self._replay_file(f"{path}.replay")
+
+    async def _replay_file(self, path: str):
+        events, bad_lines = [], []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                    event["timestamp"] = datetime.fromisoformat(event["timestamp"])
+                    events.append(event)
+                except (ValueError, KeyError, TypeError):
+                    bad_lines.append(line if line.endswith("\n") else line + "\n")
+        if bad_lines:
+            # Битые строки (например, оборванная запись при падении) — в карантин для ручного разбора
+            with open(f"{self._spill_path}.bad", "a", encoding="utf-8") as f:
+                f.writelines(bad_lines)
+            logger.error(f"Audit spill: {len(bad_lines)} unreadable lines moved to {self._spill_path}.bad")
+        for i in range(0, len(events), self._batch_size):
+            await self._flush(events[i:i + self._batch_size])  # Неудачное снова ляжет в spill-файл
+        os.remove(path)
+        logger.info(f"Audit spill replayed: {len(events)} events")
+
+
+def _process_alive(pid: int) -> bool:
     try:
-        log = AuditLog(
-            actor_id=actor_id,
-            action=action,
-            details=details
-        )
-        session.add(log)
-        await session.commit()
-    except Exception as e:
-        print(f"CRITICAL: FAILED TO WRITE AUDIT LOG: {e}")
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+audit_sink = AuditSink(
+    async_session_maker,
+    max_queue=settings.AUDIT_QUEUE_SIZE,
+    batch_size=settings.AUDIT_FLUSH_BATCH,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+    spill_path=settings.AUDIT_SPILL_PATH,
+)
+metrics.gauge("audit_queue_depth", "Событий аудита в очереди на запись", lambda: audit_sink.depth)
+
+
+async def log_action(session: AsyncSession, action: str, details: str, actor_id: int = None):
+    """
+    Записывает критическое действие в журнал.
+    Не коммитит сессию запроса: событие уходит в очередь audit_sink и пишется фоном пачкой.
+    session оставлен в сигнатуре для совместимости с вызывающим кодом.
+    """
+    audit_sink.submit({
+        "actor_id": actor_id,
+        "action": action,
+        "details": details,
+        "timestamp": datetime.utcnow(),
+    })
+
+
+def _contains(column, term: str):
+    """ILIKE '%term%' с экранированием — в Postgres его обслуживает триграммный индекс"""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
+
+
+def search_conditions(
+        since: datetime,
+        until: datetime,
+        action: Optional[str] = None,
+        actor_id: Optional[int] = None,
+        contains: Optional[str] = None,
+        any_column: bool = False,
+) -> list:
+    """
+    Условия поиска по журналу. Окно [since, until) обязательно: по нему Postgres отбрасывает
+    месячные секции целиком, и запрос не обходит всю историю.
+    any_column — искать contains и в action (как строка поиска админки), а не только в details.
+    """
+    conditions = [AuditLog.timestamp >= since, AuditLog.timestamp < until]
+    if action is not None:
+        conditions.append(AuditLog.action == action)
+    if actor_id is not None:
+        conditions.append(AuditLog.actor_id == actor_id)
+    if contains:
+        matches = _contains(AuditLog.details, contains)
+        conditions.append(or_(_contains(AuditLog.action, contains), matches) if any_column else matches)
+    return conditions
+
+
+async def limit_statement_time(session: AsyncSession, timeout_ms: int):
+    """Потолок времени запросов до конца транзакции: расследование не должно занимать БД надолго"""
+    if session.bind.dialect.name == "postgresql":
+        await session.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
@@ -0,0 +1,100 @@
+"""
+Кэш аутентифицированных пользователей для get_current_user.
+
+Ключ — sub из JWT (username). Храним не ORM-объект, а словарь полей: один и тот же объект нельзя
+привязать к нескольким сессиям сразу, а словарь можно положить и в общий бэкенд (Redis и т.п.).
+Хеш пароля в кэш не попадает: он нужен только логину и смене пароля, а они читают users из БД.
+Запись сбрасывается при изменении профиля, баланса или деактивации — в бэкенде этого процесса:
+с InMemoryBackend другие воркеры видят изменение не позже чем через AUTH_CACHE_TTL_SECONDS.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Protocol
+
+from app.core.config import settings
+from app.modules.auth.models import User
+
+# Всё, что нужно get_current_user и проверкам ролей; hashed_password — нет
+CACHED_FIELDS = {"id", "username", "full_name", "role", "balance", "is_active", "created_at", "group_number"}
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> Optional[Any]: ...
+
+    async def set(self, key: str, value: Any, ttl: float) -> None: ...
+
+    async def delete(self, *keys: str) -> None: ...
+
+
+class InMemoryBackend:
+    """LRU с TTL в памяти процесса. Для нескольких воркеров подставляется общий бэкенд с тем же интерфейсом"""
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+
+class UserCache:
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, username: str) -> Optional[User]:
+        data = await self.backend.get(f"user:{username}")
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Каждый запрос получает свой объект, общий кэшированный никто не мутирует
+        return User(**data, hashed_password="")
+
+    async def set(self, user: User) -> None:
+        await self.backend.set(f"user:{user.username}", user.model_dump(include=CACHED_FIELDS), self.ttl)
+        await self.backend.set(f"uid:{user.id}", user.username, self.ttl)
+
+    async def invalidate(self, username: str) -> None:
+        self.invalidations += 1
+        await self.backend.delete(f"user:{username}")
+
+    async def invalidate_id(self, user_id: int) -> None:
+        """Сброс по id (там, где известен только id — например, начисления в леджере)"""
+        username = await self.backend.get(f"uid:{user_id}")
+        if username is not None:
+            self.invalidations += 1
+            await self.backend.delete(f"user:{username}", f"uid:{user_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+user_cache = UserCache(InMemoryBackend(settings.AUTH_CACHE_MAX_SIZE), settings.AUTH_CACHE_TTL_SECONDS)
@@ -7,7 +7,9 @@ from sqlmodel import select
 
 from app.core.config import settings
 from app.core.db import get_session
+from app.core.logging import user_id_var
 from app.modules.auth.models import User
+from app.modules.auth.cache import user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
@@ -28,10 +30,17 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    # Ищем пользователя по токену
+    # Сначала кэш, в БД идем только на промахе
+    user = await user_cache.get(username)
+    if user is not None:
+        user_id_var.set(user.id)
+        return user
+
     result = await session.execute(select(User).where(User.username == username))
     user = result.scalars().first()
 
     if user is None:
         raise credentials_exception
+    await user_cache.set(user)
+    user_id_var.set(user.id)
     return user
@@ -6,11 +6,12 @@ from pydantic import BaseModel
 from typing import Optional
 
 from app.core.db import get_session
-from app.core.security import get_password_hash, verify_password, create_access_token
-from app.core.limiter import limiter
+from app.core.security import get_password_hash_async, verify_password_async, create_access_token
+from app.core.limiter import check_username_limit, limiter
 from app.modules.auth.models import User, UserRole
 from app.modules.audit.service import log_action
 from app.modules.auth.dependencies import get_current_user
+from app.modules.auth.cache import user_cache
 
 router = APIRouter()
 
@@ -42,7 +43,7 @@ async def register_student(user_in: UserCreate, session: AsyncSession = Depends(
         username=user_in.username,
         full_name=user_in.full_name,
         group_number=user_in.group_number,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await get_password_hash_async(user_in.password),
         role=UserRole.STUDENT,
         balance=0
     )
@@ -66,18 +67,30 @@ async def update_user_me(
         session: AsyncSession = Depends(get_session),
         current_user: User = Depends(get_current_user)
 ):
+    # current_user может прийти из кэша (не привязан к сессии), поэтому правим свежую копию из БД
+    user = await session.get(User, current_user.id)
+
     if user_update.full_name:
-        current_user.full_name = user_update.full_name
+        user.full_name = user_update.full_name
 
     if user_update.password:
-        current_user.hashed_password = get_password_hash(user_update.password)
+        user.hashed_password = await get_password_hash_async(user_update.password)
 
-    session.add(current_user)
+    session.add(user)
     await session.commit()
-    await session.refresh(current_user)
+    await session.refresh(user)
+    await user_cache.invalidate(user.username)
 
-    await log_action(session, "UPDATE_PROFILE", "User updated profile", current_user.id)
-    return current_user
+    await log_action(session, "UPDATE_PROFILE", "User updated profile", user.id)
+    return user
+
+
+@router.get("/cache/stats")
+async def user_cache_stats(current_user: User = Depends(get_current_user)):
+    """Сколько обращений к users снял кэш пользователей (счетчики этого воркера)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Нет прав")
+    return user_cache.stats()
 
 
 @router.post("/login")
@@ -87,10 +100,11 @@ async def login(
         form_data: OAuth2PasswordRequestForm = Depends(),
         session: AsyncSession = Depends(get_session)
 ):
+    await check_username_limit(form_data.username)
     result = await session.execute(select(User).where(User.username == form_data.username))
     user = result.scalars().first()
 
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         await log_action(session, "LOGIN_FAILED", f"User: {form_data.username} | IP: {request.client.host}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,92 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.modules.auth.dependencies import get_current_user
+from app.modules.auth.models import User
+from app.modules.leaderboard.service import Period, RankedEntry, leaderboard
+
+router = APIRouter()
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    username: str
+    full_name: str
+    group_number: Optional[str] = None
+    score: int
+
+
+class UserPosition(BaseModel):
+    username: str
+    group_number: Optional[str] = None
+    overall: Optional[LeaderboardEntry] = None  # Место среди всех студентов
+    in_group: Optional[LeaderboardEntry] = None  # Место внутри своей группы
+
+
+def _not_modified(request: Request, response: Response, visibility: str = "public") -> Optional[Response]:
+    """Ставит ETag по версии рейтинга; если у клиента уже актуальная копия — готовый 304"""
+    headers = {
+        "ETag": f'"lb-{leaderboard.version}"',
+        "Cache-Control": f"{visibility}, max-age={settings.LEADERBOARD_MAX_AGE}",
+    }
+    response.headers.update(headers)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+def _entry(entry: Optional[RankedEntry]) -> Optional[LeaderboardEntry]:
+    return LeaderboardEntry(**entry.__dict__) if entry else None
+
+
+@router.get("/", response_model=List[LeaderboardEntry])
+async def get_leaderboard(
+        request: Request,
+        response: Response,
+        period: Period = "all",
+        group: Optional[str] = None,
+        limit: int = Query(default=10, ge=1, le=settings.LEADERBOARD_MAX_LIMIT),
+):
+    """Топ-N по баллам: за всё время (баланс), за месяц или неделю; group — внутри одной группы"""
+    not_modified = _not_modified(request, response)
+    if not_modified is not None:
+        return not_modified
+    return [_entry(entry) for entry in leaderboard.top(period, group, limit)]
+
+
+@router.get("/me", response_model=UserPosition)
+async def get_my_position(
+        request: Request,
+        response: Response,
+        period: Period = "all",
+        current_user: User = Depends(get_current_user),
+):
+    return await get_position(current_user.username, request, response, period, current_user)
+
+
+@router.get("/users/{username}", response_model=UserPosition)
+async def get_position(
+        username: str,
+        request: Request,
+        response: Response,
+        period: Period = "all",
+        current_user: User = Depends(get_current_user),
+):
+    """Место пользователя в общем рейтинге и в рейтинге его группы"""
+    participant = leaderboard.find(username)
+    if participant is None:
+        raise HTTPException(status_code=404, detail="Студент не участвует в рейтинге")
+    not_modified = _not_modified(request, response, "private")
+    if not_modified is not None:
+        return not_modified
+    return UserPosition(
+        username=participant.username,
+        group_number=participant.group_number,
+        overall=_entry(leaderboard.position(participant.user_id, period)),
+        in_group=_entry(leaderboard.position(participant.user_id, period, participant.group_number))
+        if participant.group_number else None,
+    )
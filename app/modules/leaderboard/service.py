@@ -0,0 +1,311 @@
+"""
+Рейтинг студентов в памяти.
+
+Для каждой пары (период, группа) держится отсортированный список (-баллы, user_id): место и топ-N
+считаются бинарным поиском за O(log n), без ORDER BY по users и SUM по ledger_transactions.
+Периоды: all — текущий баланс, month / week — сумма начислений с начала месяца / недели (UTC).
+
+При старте рейтинг собирается одним агрегатным запросом, дальше обновляется инкрементально:
+писатель леджера после коммита отдает новые транзакции, и фоновая задача рейтинга применяет их сама —
+писатель не ждет ни блокировки рейтинга, ни его запросов в БД. Если в отданных транзакциях дыра
+(писал другой воркер uvicorn), задача дочитывает по id > последнего учтенного; то же раз в LEADERBOARD_REFRESH_INTERVAL.
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Literal, Optional, Tuple
+
+from sortedcontainers import SortedList
+from sqlalchemy import case, func
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import select
+
+from app.core.config import settings
+from app.core.db import async_session_maker
+from app.core.logging import logger
+from app.modules.auth.models import User, UserRole
+from app.modules.ledger.models import Transaction
+from app.modules.ledger.service import ledger_appender, lock_chain
+
+Period = Literal["all", "month", "week"]
+PERIODS: Tuple[Period, ...] = ("all", "month", "week")
+BoardKey = Tuple[Period, Optional[str]]  # (период, группа); None — по всем группам
+Row = Tuple[int, int, int, datetime]  # (id транзакции, user_id, сумма, created_at)
+MAX_PENDING = 10_000  # Дальше не копим: задача все равно дочитает из БД
+
+
+@dataclass
+class Participant:
+    user_id: int
+    username: str
+    full_name: str
+    group_number: Optional[str]
+
+
+@dataclass
+class RankedEntry:
+    rank: int
+    user_id: int
+    username: str
+    full_name: str
+    group_number: Optional[str]
+    score: int
+
+
+def period_start(period: Period, now: datetime) -> Optional[datetime]:
+    if period == "month":
+        return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        return (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    return None
+
+
+def next_period_start(now: datetime) -> datetime:
+    """Ближайшая граница недели или месяца — в этот момент доски month / week обнуляются"""
+    week = period_start("week", now) + timedelta(days=7)
+    month = (period_start("month", now) + timedelta(days=32)).replace(day=1)
+    return min(week, month)
+
+
+class Ranking:
+    """Баллы участников и их порядок; одинаковые баллы — одно место (1, 2, 2, 4)"""
+
+    def __init__(self):
+        self._scores: Dict[int, int] = {}
+        self._order = SortedList()
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def add(self, user_id: int, delta: int):
+        old = self._scores.get(user_id)
+        if old is not None:
+            self._order.remove((-old, user_id))
+        score = (old or 0) + delta
+        self._scores[user_id] = score
+        self._order.add((-score, user_id))
+
+    def score(self, user_id: int) -> Optional[int]:
+        return self._scores.get(user_id)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        return self._order.bisect_left((-score,)) + 1
+
+    def top(self, limit: int) -> List[Tuple[int, int, int]]:
+        """[(место, user_id, баллы)]"""
+        return [
+            (self._order.bisect_left((neg_score,)) + 1, user_id, -neg_score)
+            for neg_score, user_id in self._order.islice(0, limit)
+        ]
+
+
+class Leaderboard:
+    def __init__(self, session_factory: sessionmaker, refresh_interval: float):
+        self._session_factory = session_factory
+        self._refresh_interval = refresh_interval
+        self._participants: Dict[int, Participant] = {}
+        self._by_username: Dict[str, int] = {}
+        self._boards: Dict[BoardKey, Ranking] = {}
+        self._starts: Dict[Period, Optional[datetime]] = {}
+        self._last_tx_id = 0
+        self._ready = False
+        self._pending: List[Row] = []  # Транзакции от писателя этого воркера, еще не примененные
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def version(self) -> str:
+        """Меняется при каждом изменении рейтинга — основа для ETag"""
+        return f"{self._last_tx_id}-{self._starts.get('week')}"
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="leaderboard-refresh")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                if not self._ready:
+                    await self.rebuild()
+                else:
+                    await self.catch_up()
+            except Exception as e:
+                logger.error(f"Leaderboard refresh failed: {e}")
+            # Просыпаемся и на границе периода, даже если начислений нет
+            until_rollover = (next_period_start(datetime.utcnow()) - datetime.utcnow()).total_seconds()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, min(self._refresh_interval, until_rollover)))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    # --- Построение ---
+
+    def _reset_boards(self, now: datetime):
+        self._boards = {}
+        self._starts = {period: period_start(period, now) for period in PERIODS}
+
+    def _board(self, period: Period, group: Optional[str]) -> Ranking:
+        key = (period, group)
+        board = self._boards.get(key)
+        if board is None:
+            board = self._boards[key] = Ranking()
+        return board
+
+    def _add_participant(self, participant: Participant):
+        self._participants[participant.user_id] = participant
+        self._by_username[participant.username] = participant.user_id
+
+    def _credit(self, participant: Participant, period: Period, amount: int):
+        self._board(period, None).add(participant.user_id, amount)
+        if participant.group_number:
+            self._board(period, participant.group_number).add(participant.user_id, amount)
+
+    async def rebuild(self):
+        """Полная сборка одним запросом: баланс и суммы за месяц/неделю по каждому студенту"""
+        now = datetime.utcnow()
+        month_start, week_start = period_start("month", now), period_start("week", now)
+        query = (
+            select(
+                User.id, User.username, User.full_name, User.group_number, User.balance,
+                func.coalesce(func.sum(case((Transaction.created_at >= month_start, Transaction.amount), else_=0)), 0),
+                func.coalesce(func.sum(case((Transaction.created_at >= week_start, Transaction.amount), else_=0)), 0),
+            )
+            # Старше начала периодов транзакции не нужны: all берется из users.balance
+            .outerjoin(Transaction, (Transaction.target_user_id == User.id)
+                       & (Transaction.created_at >= min(month_start, week_start)))
+            .where(User.role == UserRole.STUDENT, User.is_active == True)
+            .group_by(User.id)
+        )
+        async with self._lock:
+            async with self._session_factory() as session:
+                # Под блокировкой цепочки балансы и голова согласованы: ни одна запись не вклинится между ними
+                await lock_chain(session)
+                head = (await session.execute(select(func.max(Transaction.id)))).scalar() or 0
+                rows = (await session.execute(query)).all()
+                await session.commit()
+
+            self._participants = {}
+            self._by_username = {}
+            self._reset_boards(now)
+            for user_id, username, full_name, group_number, balance, month, week in rows:
+                participant = Participant(user_id, username, full_name, group_number)
+                self._add_participant(participant)
+                self._credit(participant, "all", balance)
+                if month:
+                    self._credit(participant, "month", month)
+                if week:
+                    self._credit(participant, "week", week)
+            self._last_tx_id = head
+            self._ready = True
+        logger.info(f"Leaderboard rebuilt: {len(rows)} students, tx #{head}")
+
+    # --- Инкрементальные обновления ---
+
+    async def on_append(self, transactions: List[Transaction]):
+        """Подписчик писателя леджера: только ставит пачку в очередь и будит задачу рейтинга"""
+        if not self._ready or not transactions:
+            return
+        if len(self._pending) < MAX_PENDING:
+            self._pending.extend((tx.id, tx.target_user_id, tx.amount, tx.created_at) for tx in transactions)
+        self._wakeup.set()
+
+    def _period_changed(self, now: datetime) -> bool:
+        return any(period_start(period, now) != self._starts[period] for period in ("month", "week"))
+
+    async def catch_up(self):
+        """Применяет отданное писателем, а если в нем дыра — дочитывает новее последней учтенной (диапазон по PK)"""
+        if self._period_changed(datetime.utcnow()):
+            # Новый период начался и без начислений: month / week и version (ETag) должны смениться сразу
+            await self.rebuild()
+            return
+        async with self._lock:
+            pending, self._pending = self._pending, []
+            pending = [row for row in pending if row[0] > self._last_tx_id]
+            if all(row[0] == self._last_tx_id + 1 + i for i, row in enumerate(pending)):
+                await self._apply(pending)
+                return
+            async with self._session_factory() as session:
+                result = await session.execute(
+                    select(Transaction.id, Transaction.target_user_id, Transaction.amount, Transaction.created_at)
+                    .where(Transaction.id > self._last_tx_id)
+                    .order_by(Transaction.id)
+                )
+                rows = result.all()
+            await self._apply(rows)
+
+    async def _apply(self, rows: Iterable[Row]):
+        """Вызывается под self._lock; уже учтенные id пропускаются, чтобы начисление не попало в рейтинг дважды"""
+        rows = [row for row in rows if row[0] > self._last_tx_id]
+        if not rows:
+            return
+        if self._period_changed(datetime.utcnow()):
+            # Начался новый период: проще пересобрать всё, чем вычитать старые начисления
+            self._ready = False
+            self._wakeup.set()
+            return
+
+        await self._load_participants({user_id for _, user_id, _, _ in rows if user_id not in self._participants})
+        for tx_id, user_id, amount, created_at in rows:
+            if tx_id <= self._last_tx_id:
+                continue
+            self._last_tx_id = tx_id
+            participant = self._participants.get(user_id)
+            if participant is None:
+                continue  # Начисление не студенту (например, админу) в рейтинг не идет
+            self._credit(participant, "all", amount)
+            for period in ("month", "week"):
+                if created_at >= self._starts[period]:
+                    self._credit(participant, period, amount)
+
+    async def _load_participants(self, user_ids: set):
+        """Студенты, зарегистрированные после сборки рейтинга"""
+        if not user_ids:
+            return
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(User.id, User.username, User.full_name, User.group_number)
+                .where(User.id.in_(user_ids), User.role == UserRole.STUDENT, User.is_active == True)
+            )
+            for user_id, username, full_name, group_number in result.all():
+                self._add_participant(Participant(user_id, username, full_name, group_number))
+
+    # --- Чтение ---
+
+    def _entry(self, rank: int, user_id: int, score: int) -> RankedEntry:
+        participant = self._participants[user_id]
+        return RankedEntry(rank, user_id, participant.username, participant.full_name, participant.group_number, score)
+
+    def top(self, period: Period, group: Optional[str], limit: int) -> List[RankedEntry]:
+        board = self._boards.get((period, group))
+        if board is None:
+            return []
+        return [self._entry(*item) for item in board.top(limit)]
+
+    def position(self, user_id: int, period: Period, group: Optional[str] = None) -> Optional[RankedEntry]:
+        board = self._boards.get((period, group))
+        if board is None or board.score(user_id) is None:
+            return None
+        return self._entry(board.rank(user_id), user_id, board.score(user_id))
+
+    def find(self, username: str) -> Optional[Participant]:
+        user_id = self._by_username.get(username)
+        return self._participants.get(user_id) if user_id is not None else None
+
+
+leaderboard = Leaderboard(async_session_maker, settings.LEADERBOARD_REFRESH_INTERVAL)
+ledger_appender.subscribe(leaderboard.on_append)
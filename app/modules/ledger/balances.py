@@ -0,0 +1,137 @@
+"""
+Балансы по леджеру.
+
+users.balance — кэш для чтения за O(1). Источник истины — сумма транзакций, и чтобы не гонять
+SUM по всей таблице, периодически снимаются снимки: баланс каждого пользователя на одну и ту же
+голову цепочки (last_tx_id). Баланс по леджеру = снимок + транзакции новее снимка.
+
+Запуск по cron:
+    python -m app.modules.ledger.balances snapshot
+    python -m app.modules.ledger.balances reconcile [--fix]
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List
+
+from sqlalchemy import case, func, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.db import async_session_maker, dialect_insert, engine
+from app.modules.auth.cache import user_cache
+from app.modules.auth.models import User
+from app.modules.ledger.models import BalanceSnapshot, Transaction
+from app.modules.ledger.service import lock_chain
+
+
+@dataclass
+class BalanceMismatch:
+    user_id: int
+    username: str
+    cached: int
+    ledger: int
+
+
+async def snapshot_epoch(session: AsyncSession) -> int:
+    """id транзакции, на которую сняты текущие снимки (0 — снимков еще не было)"""
+    result = await session.exec(select(func.max(BalanceSnapshot.last_tx_id)))
+    return result.first() or 0
+
+
+async def take_snapshot(session: AsyncSession) -> int:
+    """Сдвигает снимки на текущую голову цепочки одним агрегатом по новым транзакциям"""
+    await lock_chain(session)  # Чтобы между чтением головы и агрегатом не вклинилась запись
+    head = (await session.exec(select(func.max(Transaction.id)))).first() or 0
+    epoch = await snapshot_epoch(session)
+    if head <= epoch:
+        return epoch
+
+    result = await session.exec(
+        select(Transaction.target_user_id, func.sum(Transaction.amount))
+        .where(Transaction.id > epoch, Transaction.id <= head)
+        .group_by(Transaction.target_user_id)
+    )
+    rows = [{"user_id": user_id, "last_tx_id": head, "balance": delta} for user_id, delta in result.all()]
+
+    if rows:
+        insert = dialect_insert(session)
+        stmt = insert(BalanceSnapshot).values(rows)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[BalanceSnapshot.user_id],
+            set_={"balance": BalanceSnapshot.balance + stmt.excluded.balance, "last_tx_id": head},
+        ))
+    # Остальные снимки не изменились, но тоже переезжают на новую голову
+    await session.execute(update(BalanceSnapshot).where(BalanceSnapshot.last_tx_id < head).values(last_tx_id=head))
+    await session.commit()
+    return head
+
+
+async def ledger_balance(session: AsyncSession, user_id: int) -> int:
+    """Баланс пользователя по леджеру: снимок + транзакции после него"""
+    snapshot = await session.get(BalanceSnapshot, user_id)
+    epoch = snapshot.last_tx_id if snapshot else await snapshot_epoch(session)
+    result = await session.exec(
+        select(func.coalesce(func.sum(Transaction.amount), 0))
+        .where(Transaction.target_user_id == user_id, Transaction.id > epoch)
+    )
+    return (snapshot.balance if snapshot else 0) + result.first()
+
+
+async def reconcile(session: AsyncSession, fix: bool = False) -> List[BalanceMismatch]:
+    """Сверяет users.balance с леджером для всех пользователей одним запросом"""
+    if fix:
+        await lock_chain(session)
+    epoch = await snapshot_epoch(session)
+
+    delta = (
+        select(Transaction.target_user_id.label("user_id"), func.sum(Transaction.amount).label("amount"))
+        .where(Transaction.id > epoch)
+        .group_by(Transaction.target_user_id)
+        .subquery()
+    )
+    expected = func.coalesce(BalanceSnapshot.balance, 0) + func.coalesce(delta.c.amount, 0)
+    result = await session.exec(
+        select(User.id, User.username, User.balance, expected)
+        .outerjoin(BalanceSnapshot, BalanceSnapshot.user_id == User.id)
+        .outerjoin(delta, delta.c.user_id == User.id)
+        .where(User.balance != expected)
+        .order_by(User.id)
+    )
+    mismatches = [BalanceMismatch(*row) for row in result.all()]
+
+    if fix and mismatches:
+        corrected: Dict[int, int] = {m.user_id: m.ledger for m in mismatches}
+        await session.execute(
+            update(User)
+            .where(User.id.in_(corrected.keys()))
+            .values(balance=case(corrected, value=User.id))
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        for user_id in corrected:
+            await user_cache.invalidate_id(user_id)
+    return mismatches
+
+
+async def _main(args):
+    async with async_session_maker() as session:
+        if args.command == "snapshot":
+            print(f"snapshot at tx #{await take_snapshot(session)}")
+        else:
+            mismatches = await reconcile(session, fix=args.fix)
+            for m in mismatches:
+                print(f"  user #{m.user_id} {m.username}: cached={m.cached} ledger={m.ledger}")
+            print(f"mismatches={len(mismatches)} fixed={args.fix and bool(mismatches)}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Снимки балансов и сверка с леджером")
+    parser.add_argument("command", choices=["snapshot", "reconcile"])
+    parser.add_argument("--fix", action="store_true", help="Переписать users.balance значениями из леджера")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
 import hashlib
 import json
+from functools import lru_cache
 from nacl.signing import SigningKey, VerifyKey
 from nacl.encoding import HexEncoder
+from nacl.exceptions import CryptoError
 from datetime import datetime
+from typing import Iterable, List, Tuple, Union
+
+# Сколько разобранных ключей держим в памяти (админов единицы, но процесс живет долго)
+KEY_CACHE_SIZE = 1024
 
 
 # 1. Хеширование данных транзакции
@@ -23,18 +29,43 @@ def generate_key_pair():
     return {"private_key": private_hex, "public_key": public_hex}
 
 
-# 3. Подпись данных (Делает Админ своим приватным ключом)
-def sign_data(private_key_hex: str, data_hash: str) -> str:
-    signing_key = SigningKey(private_key_hex, encoder=HexEncoder)
+# 3. Разбор ключей из hex — один раз на ключ, дальше объект берется из кэша
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def load_signing_key(private_key_hex: str) -> SigningKey:
+    return SigningKey(private_key_hex, encoder=HexEncoder)
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def load_verify_key(public_key_hex: str) -> VerifyKey:
+    return VerifyKey(public_key_hex, encoder=HexEncoder)
+
+
+# 4. Подпись данных (Делает Админ своим приватным ключом)
+def sign_data(private_key: Union[str, SigningKey], data_hash: str) -> str:
+    signing_key = private_key if isinstance(private_key, SigningKey) else load_signing_key(private_key)
     signed = signing_key.sign(data_hash.encode(), encoder=HexEncoder)
     return signed.decode()  # Возвращает подпись
 
 
-# 4. Проверка подписи (Делает Система публичным ключом Админа)
+def sign_many(private_key: Union[str, SigningKey], data_hashes: Iterable[str]) -> List[str]:
+    """Подписывает пачку хешей одним ключом"""
+    signing_key = private_key if isinstance(private_key, SigningKey) else load_signing_key(private_key)
+    return [signing_key.sign(data_hash.encode(), encoder=HexEncoder).decode() for data_hash in data_hashes]
+
+
+# 5. Проверка подписи (Делает Система публичным ключом Админа)
 def verify_signature(public_key_hex: str, data_hash: str, signature_hex: str) -> bool:
     try:
-        verify_key = VerifyKey(public_key_hex, encoder=HexEncoder)
-        verify_key.verify(data_hash.encode(), signature_hex.encode(encoder=HexEncoder))
-        return True
-    except Exception:
+        verify_key = load_verify_key(public_key_hex)
+        # sign_data отдает подписанное сообщение (подпись + хеш), проверяем и сверяем содержимое
+        message = verify_key.verify(signature_hex.encode(), encoder=HexEncoder)
+        return message == data_hash.encode()
+    except (CryptoError, ValueError, TypeError):
+        # Неверная подпись, битый hex или ключ не той длины. Прочие ошибки — это баги, их не глотаем
         return False
+
+
+def verify_many(items: Iterable[Tuple[str, str, str]]) -> List[bool]:
+    """Проверяет пачку (public_key_hex, data_hash, signature_hex)"""
+    return [verify_signature(public_key_hex, data_hash, signature_hex)
+            for public_key_hex, data_hash, signature_hex in items]
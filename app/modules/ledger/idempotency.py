@@ -0,0 +1,291 @@
+"""
+Idempotency-Key для эндпоинтов, пишущих в леджер.
+
+Повтор запроса с тем же ключом (ретрай с плохого Wi-Fi) получает сохраненный ответ: без поиска
+пользователей, хеширования, подписи и коммита — и без лишнего звена в цепочке.
+Ответы лежат в LRU этого воркера и в таблице idempotency_keys (общей для всех воркеров) до истечения TTL.
+
+Ключ сначала "занимается" строкой без ответа: параллельный дубль в другом воркере получает 409,
+а не выполняет начисление второй раз. Ошибки клиента (4xx) сохраняются как ответ. Исключение или
+отмена освобождают ключ, только если обработчик еще не дошел до записи в леджер: перед ней он
+вызывает idempotency.writing(), и после этого ошибка (в том числе обрыв соединения, пока писатель
+коммитит пачку) оставляет ключ занятым. Занятый ключ без ответа повторно не выполняется никогда, даже
+по таймауту: начисление могло закоммититься, а воркер — упасть до записи ответа. Такие ключи
+отвечают 409, пока оператор не сверит историю начислений и не освободит ключ вручную.
+
+    python -m app.modules.ledger.idempotency purge          # по cron: просроченные ключи с ответом
+    python -m app.modules.ledger.idempotency pending        # зависшие ключи без ответа
+    python -m app.modules.ledger.idempotency release 42:KEY # освободить после сверки
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, update
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import select
+
+from app.core.config import settings
+from app.core.db import async_session_maker, dialect_insert, engine
+from app.core.logging import logger
+from app.modules.ledger.models import IdempotencyKey
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    body: bytes
+    expires_at: datetime
+
+
+@dataclass
+class _Attempt:
+    written: bool = False  # Обработчик начал запись в леджер — освобождать ключ уже нельзя
+
+
+_attempt: ContextVar[Optional[_Attempt]] = ContextVar("idempotency_attempt", default=None)
+
+
+class IdempotencyStore:
+    def __init__(self, session_factory: sessionmaker, ttl: timedelta, max_cached: int, stuck_after: timedelta):
+        self._session_factory = session_factory
+        self._ttl = ttl
+        self._max_cached = max_cached
+        self._stuck_after = stuck_after
+        self._cache: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def fingerprint(endpoint: str, payload: Any) -> str:
+        body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{endpoint}|{body}".encode()).hexdigest()
+
+    async def run(
+            self,
+            key: Optional[str],
+            user_id: int,
+            endpoint: str,
+            payload: Any,
+            handler: Callable[[], Awaitable[Any]],
+    ):
+        """Выполняет handler не больше одного раза на (пользователь, ключ); без ключа — просто выполняет"""
+        if key is None:
+            return await handler()
+
+        scope_key = f"{user_id}:{key}"
+        fingerprint = self.fingerprint(endpoint, payload)
+
+        stored = self._cached(scope_key)
+        if stored is None and scope_key in self._inflight:
+            # Дубль пришел в этот же воркер, пока оригинал еще выполняется — ждем его ответ
+            await asyncio.shield(self._inflight[scope_key])
+            stored = self._cached(scope_key)
+        if stored is not None:
+            return self._replay(stored, fingerprint)
+
+        claimed, stored = await self._claim(scope_key, fingerprint)
+        if stored is not None:
+            self._remember(scope_key, stored)
+            return self._replay(stored, fingerprint)
+        if not claimed:
+            raise HTTPException(status_code=409, detail="Запрос с этим Idempotency-Key еще выполняется или был прерван")
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[scope_key] = future
+        attempt = _Attempt()
+        token = _attempt.set(attempt)
+        try:
+            try:
+                status_code, body = 200, jsonable_encoder(await handler())
+            except HTTPException as e:
+                if e.status_code >= 500:
+                    raise
+                status_code, body = e.status_code, {"detail": e.detail}
+        except BaseException as e:
+            if attempt.written:
+                # Начисление могло пройти: ключ остается занятым, повтор получит 409 (см. pending / release)
+                logger.error(f"Idempotent request {scope_key} failed after the ledger write: {e!r}")
+            else:
+                await self._release(scope_key)
+            raise
+        finally:
+            _attempt.reset(token)
+            self._inflight.pop(scope_key, None)
+            future.set_result(None)
+
+        stored = StoredResponse(fingerprint, status_code, json.dumps(body).encode(), datetime.utcnow() + self._ttl)
+        self._remember(scope_key, stored)
+        await self._complete(scope_key, stored)
+        return Response(content=stored.body, status_code=status_code, media_type="application/json")
+
+    @staticmethod
+    def writing():
+        """Обработчик вызывает прямо перед записью в леджер: дальше его ошибка ключ не освобождает"""
+        attempt = _attempt.get()
+        if attempt is not None:
+            attempt.written = True
+
+    # --- LRU ---
+
+    def _cached(self, scope_key: str) -> Optional[StoredResponse]:
+        stored = self._cache.get(scope_key)
+        if stored is None:
+            return None
+        if stored.expires_at < datetime.utcnow():
+            del self._cache[scope_key]
+            return None
+        self._cache.move_to_end(scope_key)
+        return stored
+
+    def _remember(self, scope_key: str, stored: StoredResponse):
+        self._cache[scope_key] = stored
+        self._cache.move_to_end(scope_key)
+        while len(self._cache) > self._max_cached:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _replay(stored: StoredResponse, fingerprint: str) -> Response:
+        if stored.fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key уже использован для другого запроса")
+        return Response(
+            content=stored.body,
+            status_code=stored.status_code,
+            media_type="application/json",
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    # --- Таблица ---
+
+    async def _claim(self, scope_key: str, fingerprint: str) -> Tuple[bool, Optional[StoredResponse]]:
+        """(True, None) — ключ наш; (False, ответ) — готовый ответ; (False, None) — выполняется в другом месте"""
+        now = datetime.utcnow()
+        fresh = {
+            "fingerprint": fingerprint,
+            "status_code": None,
+            "response_body": None,
+            "created_at": now,
+            "expires_at": now + self._ttl,
+        }
+        async with self._session_factory() as session:
+            insert = dialect_insert(session)
+            result = await session.execute(
+                insert(IdempotencyKey).values(key=scope_key, **fresh).on_conflict_do_nothing(index_elements=["key"])
+            )
+            if result.rowcount != 1:
+                # Ключ занят: перехватываем только просроченный ключ с готовым ответом.
+                # Без ответа — никогда: начисление могло пройти, а записать ответ воркер не успел
+                result = await session.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.key == scope_key,
+                           IdempotencyKey.status_code.is_not(None),
+                           IdempotencyKey.expires_at < now)
+                    .values(**fresh)
+                    .execution_options(synchronize_session=False)
+                )
+            await session.commit()
+            if result.rowcount == 1:
+                return True, None
+
+            row = await session.get(IdempotencyKey, scope_key)
+            if row is None or row.status_code is None:
+                return False, None
+            return False, StoredResponse(row.fingerprint, row.status_code, row.response_body.encode(), row.expires_at)
+
+    async def _complete(self, scope_key: str, stored: StoredResponse):
+        try:
+            async with self._session_factory() as session:
+                await session.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.key == scope_key)
+                    .values(status_code=stored.status_code, response_body=stored.body.decode(), expires_at=stored.expires_at)
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+        except Exception as e:
+            # Начисление уже записано: ключ не освобождаем, в этом воркере ответ есть в LRU,
+            # а остальные отвечают 409, пока оператор не освободит ключ (см. pending / release)
+            logger.error(f"Failed to store idempotent response {scope_key}: {e}")
+
+    async def _release(self, scope_key: str):
+        try:
+            await self.release(scope_key)
+        except Exception as e:
+            logger.error(f"Failed to release idempotency key {scope_key}: {e}")
+
+    async def release(self, scope_key: str) -> bool:
+        """Освобождает ключ без ответа; следующий запрос с ним выполнится заново"""
+        async with self._session_factory() as session:
+            result = await session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.key == scope_key, IdempotencyKey.status_code.is_(None))
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            return result.rowcount == 1
+
+    async def stuck(self) -> List[IdempotencyKey]:
+        """Ключи без ответа старше LEDGER_IDEMPOTENCY_PENDING_TIMEOUT — их владелец, скорее всего, упал"""
+        async with self._session_factory() as session:
+            result = await session.exec(
+                select(IdempotencyKey)
+                .where(IdempotencyKey.status_code.is_(None),
+                       IdempotencyKey.created_at < datetime.utcnow() - self._stuck_after)
+                .order_by(IdempotencyKey.created_at)
+            )
+            return list(result.all())
+
+    async def purge_expired(self) -> int:
+        async with self._session_factory() as session:
+            result = await session.execute(
+                delete(IdempotencyKey)
+                # Ключи без ответа не трогаем: их освобождает только оператор
+                .where(IdempotencyKey.status_code.is_not(None), IdempotencyKey.expires_at < datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            return result.rowcount
+
+
+idempotency = IdempotencyStore(
+    async_session_maker,
+    ttl=timedelta(hours=settings.LEDGER_IDEMPOTENCY_TTL_HOURS),
+    max_cached=settings.LEDGER_IDEMPOTENCY_CACHE_SIZE,
+    stuck_after=timedelta(seconds=settings.LEDGER_IDEMPOTENCY_PENDING_TIMEOUT),
+)
+
+
+async def _main(args):
+    try:
+        if args.command == "purge":
+            print(f"purged={await idempotency.purge_expired()}")
+        elif args.command == "pending":
+            for row in await idempotency.stuck():
+                print(f"{row.key}  since {row.created_at:%Y-%m-%d %H:%M:%S}")
+        else:
+            released = await idempotency.release(args.key)
+            print("released" if released else "not found or already completed")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание таблицы idempotency_keys")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("purge", help="Удалить просроченные ключи с ответом")
+    commands.add_parser("pending", help="Показать зависшие ключи без ответа")
+    release_parser = commands.add_parser("release", help="Освободить ключ без ответа (после сверки леджера)")
+    release_parser.add_argument("key", help="<user_id>:<Idempotency-Key>")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
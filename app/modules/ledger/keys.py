@@ -0,0 +1,140 @@
+"""
+Реестр ключей леджера.
+
+Приватные ключи админов лежат в keystore-файле (JSON {"<admin_id>": "<hex>"}), публичные — в таблице admin_keys.
+Кто своего ключа не имеет, за того подписывает система ключом из LEDGER_SIGNING_KEY.
+Каждая транзакция хранит key_id — id строки admin_keys, которой она подписана (NULL — системный ключ),
+поэтому проверка не гадает, был ли у админа ключ в момент записи и видел ли его воркер.
+Всё читается и разбирается один раз за жизнь процесса.
+
+Выпуск ключа админу:
+    python -m app.modules.ledger.keys <admin_id>
+"""
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from nacl.encoding import HexEncoder
+from nacl.signing import SigningKey
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.db import async_session_maker, engine
+from app.core.logging import logger
+from app.modules.ledger.crypto import generate_key_pair, load_signing_key
+from app.modules.ledger.models import AdminKey
+
+
+class KeyRegistry:
+    def __init__(self, system_key_hex: Optional[str], keystore_path: Optional[str]):
+        self._system_key_hex = system_key_hex
+        self._keystore_path = Path(keystore_path) if keystore_path else None
+        self._keystore: Optional[Dict[int, str]] = None
+        self._public_keys: Optional[Dict[int, str]] = None  # key_id -> публичный ключ
+
+    def system_key(self) -> SigningKey:
+        if not self._system_key_hex:
+            raise HTTPException(status_code=503, detail="Ключ подписи леджера не настроен")
+        return load_signing_key(self._system_key_hex)
+
+    def system_public_key(self) -> str:
+        return self.system_key().verify_key.encode(encoder=HexEncoder).decode()
+
+    def _load_keystore(self) -> Dict[int, str]:
+        if self._keystore is None:
+            self._keystore = {}
+            if self._keystore_path and self._keystore_path.exists():
+                raw = json.loads(self._keystore_path.read_text())
+                self._keystore = {int(admin_id): key_hex for admin_id, key_hex in raw.items()}
+        return self._keystore
+
+    async def signer(self, session: AsyncSession, admin_id: int) -> Tuple[Optional[int], SigningKey]:
+        """(key_id, ключ): личный ключ админа, если он выпущен и есть в admin_keys, иначе (None, системный)"""
+        key_hex = self._load_keystore().get(admin_id)
+        if not key_hex:
+            return None, self.system_key()
+        signing_key = load_signing_key(key_hex)
+        public_key = signing_key.verify_key.encode(encoder=HexEncoder).decode()
+        key_id = self._key_id(await self.public_keys(session), public_key)
+        if key_id is None:
+            self._public_keys = None  # Ключ могли выпустить после того, как мы прочитали таблицу
+            key_id = self._key_id(await self.public_keys(session), public_key)
+        if key_id is None:
+            # Приватный ключ без публичного в БД проверить будет нечем — подписывает система
+            logger.warning(f"Key of admin {admin_id} is not in admin_keys, signing with the system key")
+            return None, self.system_key()
+        return key_id, signing_key
+
+    @staticmethod
+    def _key_id(public_keys: Dict[int, str], public_key: str) -> Optional[int]:
+        return next((key_id for key_id, known in public_keys.items() if known == public_key), None)
+
+    async def public_keys(self, session: AsyncSession) -> Dict[int, str]:
+        """key_id -> публичный ключ (hex). Таблица маленькая, читается целиком один раз"""
+        if self._public_keys is None:
+            result = await session.exec(select(AdminKey.id, AdminKey.public_key))
+            self._public_keys = dict(result.all())
+        return self._public_keys
+
+    async def register(self, session: AsyncSession, admin_id: int) -> str:
+        """
+        Выпускает админу пару ключей: сначала коммитится публичный ключ в БД, потом пишется keystore.
+        Упади запись файла — строка удаляется; ключ, уже выданный админу, повторно не выпускается.
+        """
+        if self._keystore_path is None:
+            raise RuntimeError("LEDGER_KEYSTORE_PATH не задан")
+        existing = (await session.exec(select(AdminKey.id).where(AdminKey.admin_id == admin_id))).first()
+        # Запись в keystore без строки в БД (прошлый сбой) не в счет: ею ничего не подписано, см. signer
+        if existing is not None:
+            raise ValueError(f"У админа {admin_id} уже есть ключ")
+        pair = generate_key_pair()
+
+        row = AdminKey(admin_id=admin_id, public_key=pair["public_key"])
+        session.add(row)
+        await session.commit()
+
+        keystore = {**self._load_keystore(), admin_id: pair["private_key"]}
+        try:
+            tmp_path = self._keystore_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps({str(k): v for k, v in keystore.items()}, indent=2))
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self._keystore_path)
+        except BaseException:
+            # Ни одна транзакция этим ключом еще не подписана — строку можно убрать
+            await session.delete(row)
+            await session.commit()
+            raise
+
+        self._keystore = keystore
+        self._public_keys = None
+        return pair["public_key"]
+
+
+key_registry = KeyRegistry(settings.LEDGER_SIGNING_KEY, settings.LEDGER_KEYSTORE_PATH)
+
+
+async def _register(admin_id: int):
+    try:
+        async with async_session_maker() as session:
+            public_key = await key_registry.register(session, admin_id)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    finally:
+        await engine.dispose()
+    print(f"admin_id={admin_id} public_key={public_key}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выпуск ключа подписи для администратора")
+    parser.add_argument("admin_id", type=int)
+    args = parser.parse_args()
+    asyncio.run(_register(args.admin_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Дерево Меркла поверх леджера.
+
+Цепочка prev_hash доказывает целостность только целиком — чтобы проверить одну запись, нужно пройти
+от genesis. Поэтому транзакции по порядку id режутся на блоки (до LEDGER_MERKLE_BLOCK_SIZE штук),
+над current_hash каждого блока строится дерево Меркла (RFC 6962: лист = sha256(0x00 || hash),
+узел = sha256(0x01 || левый || правый)), а корень подписывается системным ключом.
+Блок закрывается, когда набралось BLOCK_SIZE транзакций, или когда самой старой незакрытой
+транзакции больше LEDGER_MERKLE_SEAL_INTERVAL секунд.
+
+Доказательство включения — это log2(BLOCK_SIZE) хешей: студент пересчитывает current_hash своей
+записи, сворачивает путь до корня и проверяет подпись блока, не скачивая цепочку.
+
+    python -m app.modules.ledger.merkle seal               # закрыть накопившиеся блоки
+    python -m app.modules.ledger.merkle verify proof.json  # офлайн-проверка ответа /ledger/proof/{id}
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import desc, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.db import async_session_maker, engine
+from app.core.logging import logger
+from app.modules.archive.service import archived_range
+from app.modules.ledger.crypto import calculate_hash, sign_data, verify_signature
+from app.modules.ledger.keys import key_registry
+from app.modules.ledger.models import MerkleBlock, Transaction
+from app.modules.ledger.service import lock_chain, ledger_appender
+
+EMPTY_ROOT = hashlib.sha256(b"").hexdigest()  # prev_root первого блока
+TREE_CACHE_SIZE = 64  # Сколько построенных деревьев блоков держим для выдачи доказательств
+
+
+# --- Математика дерева (без БД, пригодна для клиента) ---
+
+def leaf_hash(current_hash: str) -> bytes:
+    return hashlib.sha256(b"\x00" + current_hash.encode()).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def build_levels(leaves: Sequence[bytes]) -> List[List[bytes]]:
+    """Уровни дерева снизу вверх; непарный последний узел поднимается без изменений (как в RFC 6962)"""
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def inclusion_path(levels: List[List[bytes]], index: int) -> List[bytes]:
+    path = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            path.append(level[sibling])
+        index //= 2
+    return path
+
+
+def verify_inclusion(current_hash: str, index: int, size: int, path: Sequence[str], root: str) -> bool:
+    """Проверка доказательства включения (алгоритм RFC 9162, 2.1.3.2)"""
+    if not 0 <= index < size:
+        return False
+    fn, sn = index, size - 1
+    result = leaf_hash(current_hash)
+    for sibling_hex in path:
+        if sn == 0:
+            return False
+        sibling = bytes.fromhex(sibling_hex)
+        if fn & 1 or fn == sn:
+            result = node_hash(sibling, result)
+            if not fn & 1:
+                while not fn & 1 and fn != 0:
+                    fn >>= 1
+                    sn >>= 1
+        else:
+            result = node_hash(result, sibling)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and result.hex() == root
+
+
+def block_payload(block_id: int, first_tx_id: int, last_tx_id: int, size: int, root: str, prev_root: str) -> str:
+    return f"{block_id}|{first_tx_id}|{last_tx_id}|{size}|{root}|{prev_root}"
+
+
+# --- Блоки в БД ---
+
+@dataclass
+class InclusionProof:
+    transaction: Transaction
+    block: MerkleBlock
+    leaf_index: int
+    path: List[str]
+
+
+class MerkleAccumulator:
+    def __init__(self, session_factory: sessionmaker, block_size: int, seal_interval: float):
+        self._session_factory = session_factory
+        self._block_size = block_size
+        self._seal_interval = seal_interval
+        self._unsealed = 0  # Сколько транзакций записал этот воркер с последнего закрытия
+        self._trees: "OrderedDict[int, Tuple[List[int], List[List[bytes]]]]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="merkle-sealer")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def on_append(self, transactions: List[Transaction]):
+        """Подписчик писателя леджера: будит закрытие блока, как только мог набраться полный"""
+        self._unsealed += len(transactions)
+        if self._unsealed >= self._block_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.seal()
+            except Exception as e:
+                logger.error(f"Merkle sealing failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._seal_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def seal(self) -> int:
+        """Закрывает все готовые блоки; каждый — отдельной транзакцией под блокировкой цепочки"""
+        sealed = 0
+        while True:
+            async with self._session_factory() as session:
+                await lock_chain(session)  # Другие воркеры не закроют тот же блок, писатель не вклинится
+                last = (await session.exec(select(MerkleBlock).order_by(desc(MerkleBlock.id)).limit(1))).first()
+                result = await session.exec(
+                    select(Transaction.id, Transaction.current_hash, Transaction.created_at)
+                    .where(Transaction.id > (last.last_tx_id if last else 0))
+                    .order_by(Transaction.id)
+                    .limit(self._block_size)
+                )
+                rows = result.all()
+                young = rows and rows[0][2] > datetime.utcnow() - timedelta(seconds=self._seal_interval)
+                if not rows or (len(rows) < self._block_size and young):
+                    await session.commit()
+                    break
+
+                block_id = (last.id if last else 0) + 1
+                root = build_levels([leaf_hash(current_hash) for _, current_hash, _ in rows])[-1][0].hex()
+                prev_root = last.root if last else EMPTY_ROOT
+                first_tx_id, last_tx_id = rows[0][0], rows[-1][0]
+                session.add(MerkleBlock(
+                    id=block_id,
+                    first_tx_id=first_tx_id,
+                    last_tx_id=last_tx_id,
+                    size=len(rows),
+                    root=root,
+                    prev_root=prev_root,
+                    signature=sign_data(
+                        key_registry.system_key(),
+                        block_payload(block_id, first_tx_id, last_tx_id, len(rows), root, prev_root),
+                    ),
+                ))
+                await session.commit()
+                sealed += 1
+        self._unsealed = 0
+        if sealed:
+            logger.info(f"Merkle: sealed {sealed} block(s)")
+        return sealed
+
+    async def _tree(self, session: AsyncSession, block: MerkleBlock) -> Tuple[List[int], List[List[bytes]]]:
+        tree = self._trees.get(block.id)
+        if tree is None:
+            result = await session.exec(
+                select(Transaction.id, Transaction.current_hash)
+                .where(Transaction.id >= block.first_tx_id, Transaction.id <= block.last_tx_id)
+                .order_by(Transaction.id)
+            )
+            rows = result.all()
+            if not rows or rows[0][0] > block.first_tx_id:
+                # Начало блока уже вынесено в архив
+                merged = {tx.id: tx.current_hash for tx in await archived_range(session, block.first_tx_id, block.last_tx_id)}
+                merged.update(rows)
+                rows = sorted(merged.items())
+            tree = ([tx_id for tx_id, _ in rows], build_levels([leaf_hash(current_hash) for _, current_hash in rows]))
+            if tree[1][-1][0].hex() != block.root:
+                raise RuntimeError(f"Блок #{block.id}: корень не совпадает с транзакциями в таблице")
+            self._trees[block.id] = tree
+            while len(self._trees) > TREE_CACHE_SIZE:
+                self._trees.popitem(last=False)
+        self._trees.move_to_end(block.id)
+        return tree
+
+    async def proof(self, session: AsyncSession, transaction: Transaction) -> Optional[InclusionProof]:
+        """Доказательство включения транзакции; None — она еще не попала в закрытый блок"""
+        result = await session.exec(
+            select(MerkleBlock).where(MerkleBlock.last_tx_id >= transaction.id).order_by(MerkleBlock.last_tx_id).limit(1)
+        )
+        block = result.first()
+        if block is None or block.first_tx_id > transaction.id:
+            return None
+        ids, levels = await self._tree(session, block)
+        index = bisect_left(ids, transaction.id)
+        return InclusionProof(transaction, block, index, [node.hex() for node in inclusion_path(levels, index)])
+
+
+merkle = MerkleAccumulator(async_session_maker, settings.LEDGER_MERKLE_BLOCK_SIZE, settings.LEDGER_MERKLE_SEAL_INTERVAL)
+ledger_appender.subscribe(merkle.on_append)
+
+
+def verify_proof_document(proof: dict, public_key_hex: Optional[str] = None) -> List[str]:
+    """Проверяет ответ /ledger/proof/{id} целиком; возвращает список проблем (пустой — всё сходится)"""
+    tx, block = proof["transaction"], proof["block"]
+    problems = []
+    current_hash = calculate_hash(tx["prev_hash"], tx["target_user_id"], tx["amount"], tx["reason"], tx["hashed_timestamp"])
+    if current_hash != tx["current_hash"]:
+        problems.append("current_hash не совпадает с полями транзакции")
+    if not verify_inclusion(current_hash, proof["leaf_index"], block["size"], proof["path"], block["root"]):
+        problems.append("путь не сворачивается в корень блока")
+    payload = block_payload(block["id"], block["first_tx_id"], block["last_tx_id"], block["size"], block["root"], block["prev_root"])
+    if not verify_signature(public_key_hex or proof["public_key"], payload, block["signature"]):
+        problems.append("подпись корня блока не сходится")
+    return problems
+
+
+async def _seal():
+    print(f"sealed={await merkle.seal()}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Блоки Меркла леджера")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("seal", help="Закрыть накопившиеся блоки")
+    verify_parser = commands.add_parser("verify", help="Проверить сохраненный ответ /ledger/proof/{id}")
+    verify_parser.add_argument("proof_file")
+    verify_parser.add_argument("--public-key", help="Системный публичный ключ из доверенного источника")
+    args = parser.parse_args()
+
+    if args.command == "seal":
+        asyncio.run(_seal())
+        return
+    with open(args.proof_file) as f:
+        problems = verify_proof_document(json.load(f), args.public_key)
+    for problem in problems:
+        print(f"  {problem}")
+    print("ok" if not problems else "FAILED")
+    raise SystemExit(0 if not problems else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,22 @@
 from typing import Optional
 from datetime import datetime
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
 class Transaction(SQLModel, table=True):
     __tablename__ = "ledger_transactions"
+    __table_args__ = (
+        # Под keyset-пагинацию истории: WHERE target_user_id = ? AND (created_at, id) < (?, ?)
+        Index("ix_ledger_transactions_user_created_id", "target_user_id", "created_at", "id"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
 
     # Ссылки
     target_user_id: int = Field(index=True)  # Кому начислили (студент)
     admin_id: int = Field(index=True)  # Кто начислил (сотрудник)
+    key_id: Optional[int] = Field(default=None)  # admin_keys.id ключа подписи; None — системный ключ
 
     # Финансы
     amount: int  # Может быть плюс (награда) или минус (покупка)
@@ -22,3 +28,66 @@ class Transaction(SQLModel, table=True):
     current_hash: str = Field(unique=True)  # Хеш текущей записи
 
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class LedgerCheckpoint(SQLModel, table=True):
+    """Подписанная отметка "до этой записи цепочка проверена" — следующая проверка начнет отсюда"""
+    __tablename__ = "ledger_checkpoints"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    last_tx_id: int = Field(index=True)
+    last_hash: str
+    verified_count: int  # Сколько записей проверено в этом прогоне
+    signature: str  # Подпись системы над "last_tx_id|last_hash"
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class AdminKey(SQLModel, table=True):
+    """Публичный ключ, которым проверяются записи конкретного админа"""
+    __tablename__ = "admin_keys"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    admin_id: int = Field(unique=True, index=True)
+    public_key: str  # Ed25519, hex
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BalanceSnapshot(SQLModel, table=True):
+    """Баланс пользователя по леджеру на момент записи last_tx_id (все снимки делаются на одну голову цепочки)"""
+    __tablename__ = "balance_snapshots"
+
+    user_id: int = Field(primary_key=True)
+    last_tx_id: int
+    balance: int
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class IdempotencyKey(SQLModel, table=True):
+    """Ответ на запрос с Idempotency-Key: повтор с тем же ключом получает его, а не новую запись в цепочке"""
+    __tablename__ = "idempotency_keys"
+
+    key: str = Field(primary_key=True)  # "<user_id>:<Idempotency-Key>"
+    fingerprint: str  # sha256 эндпоинта и тела запроса
+    status_code: Optional[int] = None  # None — запрос еще выполняется
+    response_body: Optional[str] = None
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
+
+
+class MerkleBlock(SQLModel, table=True):
+    """Блок транзакций [first_tx_id, last_tx_id] с подписанным корнем дерева Меркла"""
+    __tablename__ = "ledger_merkle_blocks"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    first_tx_id: int
+    last_tx_id: int = Field(unique=True, index=True)
+    size: int  # Листьев в дереве (id транзакций могут идти с пропусками)
+    root: str  # hex
+    prev_root: str  # Корень предыдущего блока: блоки тоже выстроены в цепочку
+    signature: str  # Подпись системы над "id|first_tx_id|last_tx_id|size|root|prev_root"
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
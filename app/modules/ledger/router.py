@@ -1,16 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
-from typing import List
-from pydantic import BaseModel
+from typing import List, Literal, Optional, Tuple
+from pydantic import BaseModel, Field
 
-from app.core.db import get_session
+from app.core.db import async_session_maker, get_session
+from app.core.pagination import decode_cursor, encode_cursor
 from app.modules.auth.dependencies import get_current_user
+from app.modules.archive.service import archived_history, find_archived_transaction
 from app.modules.auth.models import User
 from app.modules.audit.service import log_action
 
 # --- ИСПРАВЛЕНИЕ: Импортируем модель, а не определяем её заново ---
+from app.core.config import settings
 from app.modules.ledger.models import Transaction
+from app.modules.ledger.verifier import verify_chain
+from app.modules.ledger.balances import reconcile
+from app.modules.ledger.idempotency import idempotency
+from app.modules.ledger.merkle import merkle
+from app.modules.ledger.keys import key_registry
+from app.modules.ledger.service import LedgerEntry, create_transaction, ledger_appender
 
 router = APIRouter()
 
@@ -22,37 +34,83 @@ class TransactionCreate(BaseModel):
     reason: str
 
 
+class BulkTransactionCreate(BaseModel):
+    # Либо явный список логинов, либо номер группы целиком
+    usernames: Optional[List[str]] = Field(default=None, max_length=settings.LEDGER_BULK_MAX_RECIPIENTS)
+    group_number: Optional[str] = None
+    amount: int
+    reason: str
+
+
+class BulkAccrualResult(BaseModel):
+    username: str
+    status: str  # "ok" или "not_found"
+    transaction_id: Optional[int] = None
+    current_hash: Optional[str] = None
+
+
+class ProofTransaction(BaseModel):
+    id: int
+    target_user_id: int
+    amount: int
+    reason: str
+    prev_hash: str
+    current_hash: str
+    hashed_timestamp: str  # created_at ровно в том виде, в каком он вошел в current_hash
+
+
+class ProofBlock(BaseModel):
+    id: int
+    first_tx_id: int
+    last_tx_id: int
+    size: int
+    root: str
+    prev_root: str
+    signature: str
+
+
+class InclusionProofResponse(BaseModel):
+    transaction: ProofTransaction
+    block: ProofBlock
+    leaf_index: int
+    path: List[str]  # Хеши соседей от листа к корню (hex)
+    public_key: str  # Системный ключ, которым подписан корень блока
+
+
 # --- Роуты ---
 
 @router.post("/accrue")
 async def accrue_points(
         tx_data: TransactionCreate,
         current_user: User = Depends(get_current_user),
-        session: AsyncSession = Depends(get_session)
+        session: AsyncSession = Depends(get_session),
+        # Повтор с тем же ключом возвращает сохраненный ответ вместо нового начисления
+        idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key", max_length=255),
 ):
     # 1. Только админ может начислять
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Только администратор может начислять баллы")
 
+    return await idempotency.run(
+        idempotency_key, current_user.id, "accrue", tx_data,
+        lambda: _accrue(tx_data, current_user, session),
+    )
+
+
+async def _accrue(tx_data: TransactionCreate, current_user: User, session: AsyncSession):
     # 2. Ищем студента
     result = await session.execute(select(User).where(User.username == tx_data.username))
     student = result.scalars().first()
     if not student:
         raise HTTPException(status_code=404, detail="Студент не найден")
 
-    # 3. Обновляем баланс
-    student.balance += tx_data.amount
-
-    # 4. Создаем запись в истории
-    new_tx = Transaction(
-        user_id=student.id,
-        amount=tx_data.amount,
-        reason=tx_data.reason
+    # 3. Пишем звено в цепочку (баланс обновляется там же)
+    key_id, signing_key = await key_registry.signer(session, current_user.id)
+    idempotency.writing()
+    await create_transaction(
+        student.id, current_user.id, tx_data.amount, tx_data.reason, signing_key, key_id
     )
-
-    session.add(new_tx)
-    session.add(student)
-    await session.commit()
+    await session.refresh(student)
 
     await log_action(session, "ACCRUE_POINTS",
                      f"Admin {current_user.username} gave {tx_data.amount} to {student.username}", current_user.id)
@@ -60,15 +118,176 @@ async def accrue_points(
     return {"status": "success", "new_balance": student.balance}
 
 
+@router.post("/accrue/bulk", response_model=List[BulkAccrualResult])
+async def accrue_points_bulk(
+        tx_data: BulkTransactionCreate,
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_session),
+        # Повтор с тем же ключом возвращает сохраненный ответ вместо нового начисления
+        idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key", max_length=255),
+):
+    """Начисление сразу многим студентам: один запрос пользователей, одна пачка в леджер, один коммит"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Только администратор может начислять баллы")
+    if not tx_data.usernames and not tx_data.group_number:
+        raise HTTPException(status_code=400, detail="Укажите usernames или group_number")
+    if tx_data.usernames and tx_data.group_number:
+        raise HTTPException(status_code=400, detail="Укажите что-то одно: usernames или group_number")
+
+    return await idempotency.run(
+        idempotency_key, current_user.id, "accrue/bulk", tx_data,
+        lambda: _accrue_bulk(tx_data, current_user, session),
+    )
+
+
+async def _accrue_bulk(tx_data: BulkTransactionCreate, current_user: User, session: AsyncSession):
+    query = select(User.id, User.username)
+    if tx_data.usernames:
+        query = query.where(User.username.in_(set(tx_data.usernames)))
+    else:
+        query = query.where(User.group_number == tx_data.group_number)
+    # На один больше лимита: так видно, что группа не влезает, и она не обрезается молча
+    result = await session.execute(query.limit(settings.LEDGER_BULK_MAX_RECIPIENTS + 1))
+    found = {username: user_id for user_id, username in result.all()}
+    if len(found) > settings.LEDGER_BULK_MAX_RECIPIENTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"В группе больше {settings.LEDGER_BULK_MAX_RECIPIENTS} студентов — начисляйте списками usernames",
+        )
+    if not found:
+        raise HTTPException(status_code=404, detail="Студенты не найдены")
+
+    key_id, signing_key = await key_registry.signer(session, current_user.id)
+    recipients = list(found)
+    idempotency.writing()
+    transactions = await ledger_appender.append_many([
+        LedgerEntry(found[username], current_user.id, tx_data.amount, tx_data.reason, signing_key, key_id)
+        for username in recipients
+    ])
+
+    await log_action(session, "ACCRUE_POINTS_BULK",
+                     f"Admin {current_user.username} gave {tx_data.amount} to {len(transactions)} users",
+                     current_user.id)
+
+    by_username = dict(zip(recipients, transactions))
+    requested = tx_data.usernames or recipients
+    return [
+        BulkAccrualResult(username=username, status="ok",
+                          transaction_id=by_username[username].id, current_hash=by_username[username].current_hash)
+        if username in by_username else BulkAccrualResult(username=username, status="not_found")
+        for username in dict.fromkeys(requested)
+    ]
+
+
+@router.get("/proof/{tx_id}", response_model=InclusionProofResponse)
+async def get_inclusion_proof(
+        tx_id: int,
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_session)
+):
+    """Доказательство, что транзакция входит в подписанный блок леджера (проверка — merkle.verify_proof_document)"""
+    transaction = await session.get(Transaction, tx_id) or await find_archived_transaction(session, tx_id)
+    # Студент видит только свои записи, и чужие id не должны отличаться от несуществующих
+    if transaction is None or (current_user.role != "admin" and transaction.target_user_id != current_user.id):
+        raise HTTPException(status_code=404, detail="Транзакция не найдена")
+
+    proof = await merkle.proof(session, transaction)
+    if proof is None:
+        raise HTTPException(status_code=404, detail="Транзакция еще не вошла в закрытый блок, повторите позже")
+    return InclusionProofResponse(
+        transaction=ProofTransaction(
+            id=transaction.id,
+            target_user_id=transaction.target_user_id,
+            amount=transaction.amount,
+            reason=transaction.reason,
+            prev_hash=transaction.prev_hash,
+            current_hash=transaction.current_hash,
+            hashed_timestamp=str(transaction.created_at),
+        ),
+        block=ProofBlock(**proof.block.model_dump(exclude={"created_at"})),
+        leaf_index=proof.leaf_index,
+        path=proof.path,
+        public_key=key_registry.system_public_key(),
+    )
+
+
+@router.post("/verify")
+async def verify_ledger(current_user: User = Depends(get_current_user)):
+    """Проверка нового хвоста цепочки от последнего чекпоинта"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Нет прав")
+    report = await verify_chain()
+    return {
+        "ok": report.ok,
+        "checked": report.checked,
+        "last_tx_id": report.last_tx_id,
+        "last_hash": report.last_hash,
+        "errors": [{"transaction_id": tx_id, "problem": problem} for tx_id, problem in report.errors],
+    }
+
+
+@router.get("/reconcile")
+async def reconcile_balances(
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_session)
+):
+    """Пользователи, у которых users.balance разошелся с леджером"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Нет прав")
+    mismatches = await reconcile(session)
+    return {"mismatches": [m.__dict__ for m in mismatches]}
+
+
+def _history_query(user_id: int, before: Optional[Tuple[datetime, int]], limit: int):
+    query = select(Transaction).where(Transaction.target_user_id == user_id)
+    if before:
+        query = query.where(tuple_(Transaction.created_at, Transaction.id) < tuple_(*before))
+    return query.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit)
+
+
+async def _history_page(session: AsyncSession, user_id: int, before: Optional[Tuple[datetime, int]], limit: int):
+    """Страница истории; когда живая таблица кончилась, продолжаем в архивных сегментах"""
+    result = await session.execute(_history_query(user_id, before, limit))
+    page = list(result.scalars().all())
+    if len(page) < limit:
+        tail = (page[-1].created_at, page[-1].id) if page else before
+        page.extend(await archived_history(session, user_id, tail, limit - len(page)))
+    return page
+
+
+async def _stream_history(user_id: int, chunk_size: int = 1000):
+    """NDJSON-выгрузка всей истории: страницами по курсору, в памяти не больше одной страницы"""
+    before = None
+    async with async_session_maker() as session:
+        while True:
+            page = await _history_page(session, user_id, before, chunk_size)
+            if not page:
+                break
+            yield "".join(tx.model_dump_json() + "\n" for tx in page)
+            if len(page) < chunk_size:
+                break
+            before = (page[-1].created_at, page[-1].id)
+            session.expunge_all()
+
+
 @router.get("/history", response_model=List[Transaction])
 async def get_my_history(
+        response: Response,
+        limit: int = Query(default=50, ge=1, le=500),
+        cursor: Optional[str] = None,
+        format: Literal["json", "ndjson"] = "json",
         current_user: User = Depends(get_current_user),
         session: AsyncSession = Depends(get_session)
 ):
     # Возвращаем историю только текущего пользователя
-    result = await session.execute(
-        select(Transaction)
-        .where(Transaction.user_id == current_user.id)
-        .order_by(Transaction.created_at.desc())
-    )
-    return result.scalars().all()
+    if format == "ndjson":
+        return StreamingResponse(_stream_history(current_user.id), media_type="application/x-ndjson")
+
+    before = decode_cursor(cursor) if cursor else None
+    page = await _history_page(session, current_user.id, before, limit + 1)
+
+    # Тело — по-прежнему список, курсор следующей страницы отдаем заголовком
+    if len(page) > limit:
+        page = page[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(page[-1].created_at, page[-1].id)
+    return page
@@ -1,53 +1,250 @@
-from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Union
+
+from nacl.signing import SigningKey
+from sqlalchemy import case, text, update
+from sqlalchemy.orm import sessionmaker
 from sqlmodel import select, desc
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.db import async_session_maker
+from app.core.logging import logger
+from app.core.metrics import ledger_appended, ledger_batch_duration, metrics
+from app.modules.archive.models import ArchiveSegment
 from app.modules.ledger.models import Transaction
-from app.modules.ledger.crypto import calculate_hash, sign_data
+from app.modules.ledger.crypto import calculate_hash, sign_many
 from app.modules.auth.models import User
-from datetime import datetime
+from app.modules.auth.cache import user_cache
+
+GENESIS_HASH = "GENESIS_HASH_000000000000000000"
+
+# Ключ advisory-lock'а цепочки (общий для всех воркеров uvicorn)
+LEDGER_LOCK_KEY = 0x4B11B1C1
+
+
+@dataclass
+class LedgerEntry:
+    target_user_id: int
+    admin_id: int
+    amount: int
+    reason: str
+    admin_private_key: Union[str, SigningKey]
+    key_id: Optional[int] = None  # AdminKey.id ключа admin_private_key; None — системный ключ
+
+
+@dataclass
+class _AppendRequest:
+    entries: List[LedgerEntry]
+    future: asyncio.Future = field(repr=False)
+
+
+class LedgerAppender:
+    """
+    Единственный писатель в леджер.
+    Запросы на начисление складываются в очередь, фоновая задача забирает их пачкой,
+    выстраивает цепочку хешей в памяти и пишет всё одним коммитом.
+    Между воркерами цепочку защищает pg_advisory_xact_lock, поэтому prev_hash не форкается.
+    """
+
+    def __init__(self, session_factory: sessionmaker, max_batch: int = 256, max_queue: int = 10_000):
+        self._session_factory = session_factory
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._max_batch = max_batch
+        self._task: Optional[asyncio.Task] = None
+        self._subscribers: List[Callable[[List[Transaction]], Awaitable[None]]] = []
+
+    def subscribe(self, callback: Callable[[List[Transaction]], Awaitable[None]]):
+        """
+        callback(transactions) вызывается после коммита каждой пачки, уже после ответа запросам.
+        Он ждется внутри цикла писателя, поэтому должен быть быстрым: тяжелую работу — в свою задачу.
+        """
+        self._subscribers.append(callback)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="ledger-appender")
+
+    async def stop(self):
+        """Дожидается записи всего, что уже в очереди, и останавливает писателя"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def append(
+            self,
+            target_user_id: int,
+            admin_id: int,
+            amount: int,
+            reason: str,
+            admin_private_key: Union[str, SigningKey],
+            key_id: Optional[int] = None
+    ) -> Transaction:
+        entry = LedgerEntry(target_user_id, admin_id, amount, reason, admin_private_key, key_id)
+        transactions = await self.append_many([entry])
+        return transactions[0]
+
+    async def append_many(self, entries: List[LedgerEntry]) -> List[Transaction]:
+        """Записывает несколько звеньев подряд, без разрывов между ними"""
+        if not entries:
+            return []
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_AppendRequest(entries, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0].entries)
+            while size < self._max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                size += len(batch[-1].entries)
+            try:
+                await self._write_requests(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write_requests(self, batch: List[_AppendRequest]):
+        """Пачка — одним коммитом; если он упал, каждый запрос пишется отдельно и ошибку получает только виновный"""
+        try:
+            transactions = await self._write_batch([entry for item in batch for entry in item.entries])
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(e)
+                return
+            logger.warning(f"Ledger batch of {len(batch)} requests failed ({e}), retrying one by one")
+            for item in batch:
+                await self._write_requests([item])
+            return
+
+        offset = 0
+        for item in batch:
+            chunk = transactions[offset:offset + len(item.entries)]
+            offset += len(item.entries)
+            if not item.future.done():
+                item.future.set_result(chunk)
+        await self._notify(transactions)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def _notify(self, transactions: List[Transaction]):
+        for callback in self._subscribers:
+            try:
+                await callback(transactions)
+            except Exception as e:
+                # Запись уже закоммичена: ошибка подписчика не должна ронять писателя
+                logger.error(f"Ledger subscriber {callback!r} failed: {e}")
+
+    async def _write_batch(self, batch: List[LedgerEntry]) -> List[Transaction]:
+        start = time.perf_counter()
+        async with self._session_factory() as session:
+            await lock_chain(session)
+            prev_hash = await get_chain_head(session)
+
+            transactions = chain_transactions(prev_hash, batch)
+            deltas = {}
+            for item in batch:
+                deltas[item.target_user_id] = deltas.get(item.target_user_id, 0) + item.amount
+
+            session.add_all(transactions)
+            await apply_balance_deltas(session, deltas)
+            await session.commit()
+        ledger_batch_duration.observe(time.perf_counter() - start)
+        ledger_appended.inc(amount=len(transactions))
+
+        for user_id in deltas:
+            await user_cache.invalidate_id(user_id)
+        return transactions
+
+
+async def lock_chain(session: AsyncSession):
+    """Берет транзакционную блокировку цепочки (только Postgres, снимается на коммите)"""
+    if session.bind.dialect.name == "postgresql":
+        await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LEDGER_LOCK_KEY})
+
+
+async def get_chain_head(session: AsyncSession) -> str:
+    """Возвращает current_hash последней записи (или genesis, если леджер пуст)"""
+    query = select(Transaction.current_hash).order_by(desc(Transaction.id)).limit(1)
+    result = await session.exec(query)
+    head = result.first()
+    if head is None:
+        # Живая таблица пуста после архивации — цепочка продолжается от последнего сегмента
+        result = await session.exec(
+            select(ArchiveSegment.last_hash)
+            .where(ArchiveSegment.table_name == Transaction.__tablename__)
+            .order_by(desc(ArchiveSegment.last_id))
+            .limit(1)
+        )
+        head = result.first()
+    return head or GENESIS_HASH
+
+
+def chain_transactions(prev_hash: str, entries: List[LedgerEntry]) -> List[Transaction]:
+    """Выстраивает звенья цепочки в памяти и подписывает их (без записи в БД)"""
+    transactions = []
+    for entry in entries:
+        created_at = datetime.utcnow()
+        current_hash = calculate_hash(prev_hash, entry.target_user_id, entry.amount, entry.reason, str(created_at))
+        transactions.append(Transaction(
+            target_user_id=entry.target_user_id,
+            admin_id=entry.admin_id,
+            key_id=entry.key_id,
+            amount=entry.amount,
+            reason=entry.reason,
+            prev_hash=prev_hash,
+            signature="",
+            current_hash=current_hash,
+            created_at=created_at  # Тот же момент, что попал в хеш, иначе цепочку не перепроверить
+        ))
+        prev_hash = current_hash
+
+    # Подпись не влияет на следующий хеш, поэтому подписываем пачками — по одной на ключ
+    by_key = {}
+    for entry, tx in zip(entries, transactions):
+        by_key.setdefault(id(entry.admin_private_key), (entry.admin_private_key, []))[1].append(tx)
+    for private_key, group in by_key.values():
+        for tx, signature in zip(group, sign_many(private_key, [tx.current_hash for tx in group])):
+            tx.signature = signature
+    return transactions
+
+
+async def apply_balance_deltas(session: AsyncSession, deltas: dict):
+    """Одним UPDATE прибавляет суммы к балансам (кэшу) нескольких пользователей"""
+    if not deltas:
+        return
+    await session.execute(
+        update(User)
+        .where(User.id.in_(deltas.keys()))
+        .values(balance=User.balance + case(deltas, value=User.id, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+
+ledger_appender = LedgerAppender(async_session_maker)
+metrics.gauge("ledger_append_queue_depth", "Запросов на начисление в очереди писателя", lambda: ledger_appender.depth)
+
 
 async def create_transaction(
-        session: AsyncSession,
         target_user_id: int,
         admin_id: int,
         amount: int,
         reason: str,
-        admin_private_key: str  # В реале ключ не должен летать по сети, но для MVP ок
+        admin_private_key: Union[str, SigningKey],  # В реале ключ не должен летать по сети, но для MVP ок
+        key_id: Optional[int] = None
 ):
-    # 1. Ищем последнюю транзакцию (Genesis block logic)
-    query = select(Transaction).order_by(desc(Transaction.id)).limit(1)
-    result = await session.exec(query)
-    last_tx = result.first()
-
-    # Если это первая запись в истории вуза
-    prev_hash = last_tx.current_hash if last_tx else "GENESIS_HASH_000000000000000000"
-
-    # 2. Формируем данные
-    timestamp_str = str(datetime.utcnow())
-    current_hash = calculate_hash(prev_hash, target_user_id, amount, reason, timestamp_str)
-
-    # 3. Подписываем (как будто это сделала Арутюнова В.Ю.)
-    signature = sign_data(admin_private_key, current_hash)
-
-    # 4. Сохраняем в Леджер
-    new_tx = Transaction(
-        target_user_id=target_user_id,
-        admin_id=admin_id,
-        amount=amount,
-        reason=reason,
-        prev_hash=prev_hash,
-        signature=signature,
-        current_hash=current_hash,
-        created_at=datetime.utcnow()  # В идеале юзать тот же timestamp_str
-    )
-
-    session.add(new_tx)
-
-    # 5. Обновляем баланс студента (кэш)
-    student = await session.get(User, target_user_id)
-    if student:
-        student.balance += amount
-        session.add(student)
-
-    await session.commit()
-    await session.refresh(new_tx)
-    return new_tx
+    # Запись идет через единственного писателя: он сам берет голову цепочки и коммитит пачкой
+    return await ledger_appender.append(target_user_id, admin_id, amount, reason, admin_private_key, key_id)
@@ -0,0 +1,192 @@
+"""
+Проверка целостности леджера.
+
+Таблица читается по возрастанию id серверным курсором, связность prev_hash проверяется
+последовательно, а пересчет хеша и проверка подписи Ed25519 (самое дорогое) уходят
+в пул процессов. После успешного прогона пишется подписанный чекпоинт, и следующая
+проверка идет только по новому хвосту. Вынесенные в архив строки (app/modules/archive)
+читаются из сегментов перед живой таблицей, так что полный аудит по-прежнему идет от genesis.
+
+Запуск вручную:
+    python -m app.modules.ledger.verifier          # инкрементально от последнего чекпоинта
+    python -m app.modules.ledger.verifier --full   # полный аудит от genesis
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import select, desc
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.db import async_session_maker
+from app.modules.archive.service import iter_archived_transactions
+from app.modules.ledger.crypto import calculate_hash, sign_data, verify_many, verify_signature
+from app.modules.ledger.keys import key_registry
+from app.modules.ledger.models import LedgerCheckpoint, Transaction
+from app.modules.ledger.service import GENESIS_HASH
+
+STREAM_PARTITION = 5000  # Сколько строк забираем из курсора за раз
+CHUNK_SIZE = 1000  # Сколько строк отдаем одному процессу
+INLINE_THRESHOLD = 2000  # Весь хвост короче — проверяем в потоке, без пула процессов: его запуск дороже самой проверки
+MAX_REPORTED_ERRORS = 100
+
+
+@dataclass
+class VerificationReport:
+    ok: bool = True
+    checked: int = 0
+    started_after_id: int = 0
+    last_tx_id: int = 0
+    last_hash: str = GENESIS_HASH
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+
+    def add_error(self, tx_id: int, problem: str):
+        self.ok = False
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((tx_id, problem))
+
+
+def _checkpoint_payload(last_tx_id: int, last_hash: str) -> str:
+    return f"{last_tx_id}|{last_hash}"
+
+
+def _verify_chunk(rows: list, public_keys: Dict[int, str], default_key: str) -> List[Tuple[int, str]]:
+    """Пересчитывает хеши и проверяет подписи пачки строк (выполняется в процессе пула)"""
+    problems = []
+    to_verify = []
+    for tx_id, prev_hash, target_user_id, amount, reason, created_at, current_hash, signature, key_id in rows:
+        if calculate_hash(prev_hash, target_user_id, amount, reason, str(created_at)) != current_hash:
+            problems.append((tx_id, "hash_mismatch"))
+        else:
+            to_verify.append((tx_id, (public_keys.get(key_id, default_key), current_hash, signature)))
+
+    # Ключи разбираются один раз на процесс (кэш в crypto), поэтому проверка упирается только в Ed25519
+    results = verify_many(item for _, item in to_verify)
+    problems.extend((tx_id, "bad_signature") for (tx_id, _), ok in zip(to_verify, results) if not ok)
+    return problems
+
+
+async def _load_checkpoint(session: AsyncSession, public_key_hex: str) -> Optional[LedgerCheckpoint]:
+    result = await session.exec(select(LedgerCheckpoint).order_by(desc(LedgerCheckpoint.id)).limit(1))
+    checkpoint = result.first()
+    if checkpoint is None:
+        return None
+    payload = _checkpoint_payload(checkpoint.last_tx_id, checkpoint.last_hash)
+    if not verify_signature(public_key_hex, payload, checkpoint.signature):
+        raise RuntimeError(f"Чекпоинт #{checkpoint.id} подделан: подпись не сходится")
+    return checkpoint
+
+
+async def _partitions(session: AsyncSession, after_id: int) -> AsyncIterator[List[tuple]]:
+    """Строки цепочки с id > after_id по возрастанию: сначала из архива, затем из таблицы"""
+    async for chunk in iter_archived_transactions(session, after_id):
+        yield [
+            (tx.id, tx.prev_hash, tx.target_user_id, tx.amount, tx.reason,
+             tx.created_at, tx.current_hash, tx.signature, tx.key_id)
+            for tx in chunk
+        ]
+
+    query = (
+        select(
+            Transaction.id, Transaction.prev_hash, Transaction.target_user_id, Transaction.amount,
+            Transaction.reason, Transaction.created_at, Transaction.current_hash, Transaction.signature, Transaction.key_id,
+        )
+        .where(Transaction.id > after_id)
+        .order_by(Transaction.id)
+        .execution_options(yield_per=STREAM_PARTITION)
+    )
+    result = await session.stream(query)
+    async for partition in result.partitions(STREAM_PARTITION):
+        yield [tuple(row) for row in partition]
+
+
+async def verify_chain(
+        session_factory: sessionmaker = async_session_maker,
+        full: bool = False,
+        workers: Optional[int] = None
+) -> VerificationReport:
+    public_key_hex = key_registry.system_public_key()
+    report = VerificationReport()
+
+    async with session_factory() as session:
+        public_keys = await key_registry.public_keys(session)
+        checkpoint = None if full else await _load_checkpoint(session, public_key_hex)
+        if checkpoint:
+            report.started_after_id = report.last_tx_id = checkpoint.last_tx_id
+            report.last_hash = checkpoint.last_hash
+
+        loop = asyncio.get_running_loop()
+        pool: Optional[ProcessPoolExecutor] = None
+        pending = []
+        buffer: List[tuple] = []  # Прочитанные строки, еще не отданные на проверку
+        max_pending = (workers or os.cpu_count() or 1) * 2
+        try:
+            # Архив приходит блоками по ARCHIVE_BLOCK_RECORDS, таблица — по STREAM_PARTITION:
+            # пул выбирается по длине всего хвоста, а не одной порции, и получает ровные куски по CHUNK_SIZE
+            async for rows in _partitions(session, report.started_after_id):
+                for row in rows:
+                    if row[1] != report.last_hash:
+                        report.add_error(row[0], "broken_link")
+                    report.last_tx_id, report.last_hash = row[0], row[6]
+                report.checked += len(rows)
+                buffer.extend(rows)
+                if pool is None and report.checked <= INLINE_THRESHOLD:
+                    continue
+
+                if pool is None:
+                    # spawn, а не fork: fork из процесса с запущенным event loop, потоками и соединениями
+                    # копирует их состояние (в том числе захваченные блокировки) в дочерние процессы
+                    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                while len(buffer) >= CHUNK_SIZE:
+                    chunk, buffer = buffer[:CHUNK_SIZE], buffer[CHUNK_SIZE:]
+                    pending.append(loop.run_in_executor(pool, _verify_chunk, chunk, public_keys, public_key_hex))
+                # Не копим в памяти весь леджер, если проверка отстает от чтения
+                if len(pending) >= max_pending:
+                    for problems in await asyncio.gather(*pending):
+                        for problem in problems:
+                            report.add_error(*problem)
+                    pending.clear()
+
+            if buffer:
+                # Короткий хвост целиком (или остаток) — в потоке или в пуле, но не в event loop: /verify вызывается из API
+                pending.append(loop.run_in_executor(pool, _verify_chunk, buffer, public_keys, public_key_hex))
+            for problems in await asyncio.gather(*pending):
+                for problem in problems:
+                    report.add_error(*problem)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        if report.ok and report.checked:
+            session.add(LedgerCheckpoint(
+                last_tx_id=report.last_tx_id,
+                last_hash=report.last_hash,
+                verified_count=report.checked,
+                signature=sign_data(key_registry.system_key(), _checkpoint_payload(report.last_tx_id, report.last_hash)),
+            ))
+            await session.commit()
+
+    report.errors.sort()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка цепочки леджера")
+    parser.add_argument("--full", action="store_true", help="Игнорировать чекпоинт и проверить всё от genesis")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов для проверки подписей")
+    args = parser.parse_args()
+
+    report = asyncio.run(verify_chain(full=args.full, workers=args.workers))
+    print(f"checked={report.checked} after_id={report.started_after_id} last_id={report.last_tx_id} ok={report.ok}")
+    for tx_id, problem in report.errors:
+        print(f"  #{tx_id}: {problem}")
+    raise SystemExit(0 if report.ok else 1)
+
+
+if __name__ == "__main__":
+    main()
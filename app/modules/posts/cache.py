@@ -0,0 +1,68 @@
+"""
+Кэш ленты постов.
+
+Лента меняется только когда админ создает/удаляет пост (или фоном появляется миниатюра),
+поэтому страницы храним уже сериализованными байтами вместе с ETag и сбрасываем при изменениях.
+TTL страхует другие воркеры uvicorn: их кэш узнает об изменении не позже чем через FEED_CACHE_TTL_SECONDS.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+FeedKey = Tuple[Optional[str], int]  # (before, limit)
+
+
+@dataclass
+class FeedPage:
+    body: bytes
+    etag: str
+    next_cursor: Optional[str]
+    last_modified: datetime
+    expires_at: float
+
+
+class FeedCache:
+    def __init__(self, ttl: float, max_pages: int):
+        self.ttl = ttl
+        self._max_pages = max_pages
+        self._pages: "OrderedDict[FeedKey, FeedPage]" = OrderedDict()
+
+    @staticmethod
+    def _now() -> datetime:
+        # HTTP-даты с точностью до секунды, иначе If-Modified-Since никогда не совпадет
+        return datetime.now(timezone.utc).replace(microsecond=0)
+
+    def get(self, key: FeedKey) -> Optional[FeedPage]:
+        page = self._pages.get(key)
+        if page is None or page.expires_at < time.monotonic():
+            return None
+        self._pages.move_to_end(key)
+        return page
+
+    def put(self, key: FeedKey, body: bytes, next_cursor: Optional[str]) -> FeedPage:
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        # Если по истечении TTL содержимое не поменялось, дата изменения тоже остается прежней
+        previous = self._pages.get(key)
+        page = FeedPage(
+            body=body,
+            etag=etag,
+            next_cursor=next_cursor,
+            last_modified=previous.last_modified if previous and previous.etag == etag else self._now(),
+            expires_at=time.monotonic() + self.ttl,
+        )
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        while len(self._pages) > self._max_pages:
+            self._pages.popitem(last=False)
+        return page
+
+    def invalidate(self):
+        self._pages.clear()
+
+
+feed_cache = FeedCache(settings.FEED_CACHE_TTL_SECONDS, settings.FEED_CACHE_MAX_PAGES)
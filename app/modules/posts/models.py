@@ -0,0 +1,15 @@
+from typing import Optional
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+
+
+class Post(SQLModel, table=True):
+    __tablename__ = "posts"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    title: str
+    content: str
+    image_url: Optional[str] = None
+    image_sha256: Optional[str] = None  # Картинка в хранилище blobs
+    thumbnail_url: Optional[str] = None  # Миниатюра для ленты (появляется после фоновой обработки)
+    created_at: datetime = Field(default_factory=datetime.now)
+    author_id: int
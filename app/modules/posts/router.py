@@ -1,32 +1,69 @@
-import shutil
-import os
-from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy import tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlmodel import select, Field, SQLModel
+from sqlmodel import select
+from app.core.config import settings
 from app.core.db import get_session
+from app.core.pagination import decode_cursor, encode_cursor
+from app.modules.storage.service import blob_url, purge_files, release_blob, store_blob
+from app.modules.storage.derivatives import derivatives
 from app.modules.auth.dependencies import get_current_user
 from app.modules.auth.models import User
+from app.modules.posts.models import Post
+from app.modules.posts.cache import feed_cache
 
 router = APIRouter()
 
-UPLOAD_DIR = "uploads/posts"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+_posts_adapter = TypeAdapter(List[Post])
+
+
+def _not_modified(request: Request, page) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return page.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return page.last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
 
-class Post(SQLModel, table=True):
-    __tablename__ = "posts"
-    id: Optional[int] = Field(default=None, primary_key=True)
-    title: str
-    content: str
-    image_url: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.now)
-    author_id: int
 
 @router.get("/", response_model=List[Post])
-async def get_posts(session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(Post).order_by(Post.created_at.desc()))
-    return result.scalars().all()
+async def get_posts(
+    request: Request,
+    before: Optional[str] = None,
+    limit: int = Query(default=settings.FEED_PAGE_SIZE, ge=1, le=100),
+    session: AsyncSession = Depends(get_session)
+):
+    key = (before, limit)
+    page = feed_cache.get(key)
+    if page is None:
+        query = select(Post)
+        if before:
+            query = query.where(tuple_(Post.created_at, Post.id) < tuple_(*decode_cursor(before)))
+        result = await session.execute(query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit + 1))
+        posts = result.scalars().all()
+        next_cursor = None
+        if len(posts) > limit:
+            posts = posts[:limit]
+            next_cursor = encode_cursor(posts[-1].created_at, posts[-1].id)
+        page = feed_cache.put(key, _posts_adapter.dump_json(posts), next_cursor)
+
+    headers = {
+        "ETag": page.etag,
+        "Last-Modified": format_datetime(page.last_modified, usegmt=True),
+        "Cache-Control": "public, no-cache",  # Хранить можно, но каждый раз переспрашивать — это дешево (304)
+    }
+    if page.next_cursor:
+        headers["X-Next-Cursor"] = page.next_cursor
+    if _not_modified(request, page):
+        return Response(status_code=304, headers=headers)
+    return Response(content=page.body, media_type="application/json", headers=headers)
 
 @router.post("/")
 async def create_post(
@@ -40,19 +77,21 @@ async def create_post(
          raise HTTPException(status_code=403, detail="Нет прав")
 
     image_path = None
+    image_sha256 = None
     if image:
-        # Сохраняем файл так, чтобы его можно было раздать через StaticFiles
-        filename = f"{datetime.now().timestamp()}_{image.filename}"
-        file_location = f"{UPLOAD_DIR}/{filename}"
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        # Формируем URL (предполагаем, что uploads раздается по /static)
-        image_path = f"/static/posts/{filename}"
+        # Сохраняем файл в хранилище по хешу, раздается через StaticFiles
+        stored = await store_blob(session, image, "post_image")
+        image_path = blob_url(stored.sha256, stored.file_type)
+        image_sha256 = stored.sha256
 
-    new_post = Post(title=title, content=content, image_url=image_path, author_id=current_user.id)
+    new_post = Post(title=title, content=content, image_url=image_path, image_sha256=image_sha256,
+                    author_id=current_user.id)
     session.add(new_post)
     await session.commit()
     await session.refresh(new_post)
+    feed_cache.invalidate()
+    if image_sha256:
+        derivatives.schedule(image_sha256, stored.file_type)
     return new_post
 
 @router.delete("/{post_id}")
@@ -60,6 +99,9 @@ async def delete_post(post_id: int, current_user: User = Depends(get_current_use
     post = await session.get(Post, post_id)
     if not post: raise HTTPException(status_code=404)
     if current_user.role != "admin": raise HTTPException(status_code=403)
+    orphaned = await release_blob(session, post.image_sha256)
     await session.delete(post)
     await session.commit()
+    feed_cache.invalidate()
+    await purge_files(orphaned)
     return {"ok": True}
@@ -18,6 +18,9 @@ class Proof(SQLModel, table=True):
 
     filename: str
     file_path: str
+    blob_sha256: Optional[str] = Field(default=None, index=True)  # Содержимое в хранилище blobs
+    thumbnail_url: Optional[str] = None  # Миниатюра и превью первой страницы — строятся фоном
+    preview_url: Optional[str] = None
     description: str
 
     status: ProofStatus = Field(default=ProofStatus.PENDING)
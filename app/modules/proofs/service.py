@@ -1,62 +1,43 @@
-import shutil
-import uuid
-from pathlib import Path
 from fastapi import UploadFile, HTTPException
+from sqlmodel import select
 from app.modules.proofs.models import Proof, ProofStatus
-
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
-
-# Сигнатуры безопасных файлов (Hex заголовки)
-ALLOWED_MAGIC_NUMBERS = {
-    b'\xFF\xD8\xFF': "jpg",  # JPEG
-    b'\x89\x50\x4E\x47': "png",  # PNG
-    b'\x25\x50\x44\x46': "pdf"  # PDF
-}
-
-
-async def validate_file_header(file: UploadFile):
-    """Проверяет реальный тип файла по байтам, а не по расширению"""
-    # Читаем первые 4 байта
-    header = await file.read(4)
-    # ОБЯЗАТЕЛЬНО возвращаем каретку в начало, иначе файл сохранится пустым
-    await file.seek(0)
-
-    is_valid = False
-    for magic, ext in ALLOWED_MAGIC_NUMBERS.items():
-        if header.startswith(magic):
-            is_valid = True
-            break
-
-    if not is_valid:
-        raise HTTPException(
-            status_code=400,
-            detail="Security Alert: Invalid file format. Only JPG, PNG, PDF allowed."
-        )
+from app.modules.storage.service import purge_files, release_blob, store_blob
+from app.modules.storage.derivatives import derivatives
 
 
 async def save_proof_file(file: UploadFile, user_id: int, description: str, session) -> Proof:
-    # 1. Проверка на вирусы/скрипты
-    await validate_file_header(file)
+    # 1. Сохраняем в хранилище по хешу содержимого (одинаковые файлы лежат на диске один раз).
+    # Сигнатура (защита от вирусов/скриптов) проверяется на первом чанке, без лишнего seek
+    stored = await store_blob(session, file, "proof")
 
-    # 2. Генерируем безопасное имя
-    file_ext = file.filename.split(".")[-1]
-    safe_filename = f"{uuid.uuid4()}.{file_ext}"
-    file_path = UPLOAD_DIR / safe_filename
-
-    # 3. Сохраняем на диск
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # 2. Тот же файл от того же студента — дубль, второй раз на проверку не ставим
+    result = await session.execute(
+        select(Proof.id).where(Proof.user_id == user_id, Proof.blob_sha256 == stored.sha256).limit(1)
+    )
+    if result.first():
+        await session.rollback()
+        await purge_files([stored.path])  # Файл остается, только если на blob еще есть ссылки
+        raise HTTPException(status_code=409, detail="Этот файл уже загружен")
 
-    # 4. Записываем в БД
+    # 3. Записываем в БД
     proof = Proof(
         user_id=user_id,
-        filename=file.filename,
-        file_path=str(file_path),
+        filename=stored.original_name,
+        file_path=str(stored.path),
+        blob_sha256=stored.sha256,
         description=description,
         status=ProofStatus.PENDING
     )
     session.add(proof)
     await session.commit()
     await session.refresh(proof)
+    derivatives.schedule(stored.sha256, stored.file_type)
     return proof
+
+
+async def delete_proof(proof: Proof, session):
+    """Удаляет доказательство; файл уходит с диска, только если на него больше никто не ссылается"""
+    orphaned = await release_blob(session, proof.blob_sha256)
+    await session.delete(proof)
+    await session.commit()
+    await purge_files(orphaned)
@@ -0,0 +1,133 @@
+"""
+Производные загрузок: миниатюры и превью.
+
+После загрузки картинки или PDF задача уходит в пул процессов (ресайз и рендер страницы — чистый CPU).
+Готовые файлы кладутся рядом с blob, а ссылки на них проставляются всем постам и доказательствам
+с этим содержимым. Оригинал по-прежнему доступен по image_url / file_path.
+
+Pillow и pypdfium2 — необязательные зависимости: без них производные просто не строятся.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.core.db import async_session_maker
+from app.core.logging import logger
+from app.modules.posts.cache import feed_cache
+from app.modules.posts.models import Post
+from app.modules.proofs.models import Proof
+from app.modules.storage.service import blob_path, blob_url
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+THUMB_SIZE = 320
+PREVIEW_SIZE = 1280
+
+# variant -> расширение файла
+VARIANTS = {"thumb": "webp", "preview": "jpg"}
+PDF_VARIANTS = {"thumb": "webp", "preview": "png"}
+
+
+def _variants_for(file_type: str) -> Dict[str, str]:
+    return PDF_VARIANTS if file_type == "pdf" else VARIANTS
+
+
+def render_derivatives(sha256: str, file_type: str) -> Dict[str, str]:
+    """Строит производные для blob (выполняется в процессе пула). Возвращает variant -> расширение"""
+    variants = _variants_for(file_type)
+    targets = {variant: blob_path(sha256, ext, variant) for variant, ext in variants.items()}
+    if all(path.exists() for path in targets.values()):
+        return variants  # Такое содержимое уже загружали — производные готовы
+
+    source = blob_path(sha256, file_type)
+    if file_type == "pdf":
+        if pypdfium2 is None or Image is None:
+            return {}
+        pdf = pypdfium2.PdfDocument(str(source))
+        try:
+            page = pdf[0]
+            scale = PREVIEW_SIZE / max(page.get_size())
+            image = page.render(scale=scale).to_pil()
+        finally:
+            pdf.close()
+    else:
+        if Image is None:
+            return {}
+        image = Image.open(source)
+        image.draft("RGB", (PREVIEW_SIZE, PREVIEW_SIZE))  # JPEG декодируется сразу в уменьшенном виде
+        image = image.convert("RGB")
+
+    preview = image.copy()
+    preview.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE))
+    _save_atomic(preview, targets["preview"], quality=85, optimize=True)
+
+    thumb = image.copy()
+    thumb.thumbnail((THUMB_SIZE, THUMB_SIZE))
+    _save_atomic(thumb, targets["thumb"], quality=80, method=4)
+    return variants
+
+
+def _save_atomic(image, path: Path, **options):
+    tmp = path.with_name(f".{path.name}.tmp")
+    image.save(tmp, format={"jpg": "JPEG", "png": "PNG", "webp": "WEBP"}[path.suffix[1:]], **options)
+    tmp.replace(path)
+
+
+class DerivativePipeline:
+    def __init__(self, workers: int):
+        self._workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def schedule(self, sha256: str, file_type: str):
+        """Ставит blob в очередь на обработку; вызывать после коммита строки, которая на него ссылается"""
+        if self._pool is None:
+            # spawn, а не fork: пул создается внутри воркера uvicorn с event loop, потоком логов и соединениями БД
+            self._pool = ProcessPoolExecutor(max_workers=self._workers, mp_context=multiprocessing.get_context("spawn"))
+        task = asyncio.create_task(self._process(sha256, file_type))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, sha256: str, file_type: str):
+        try:
+            loop = asyncio.get_running_loop()
+            variants = await loop.run_in_executor(self._pool, render_derivatives, sha256, file_type)
+            if not variants:
+                return
+            urls = {variant: blob_url(sha256, ext, variant) for variant, ext in variants.items()}
+            async with async_session_maker() as session:
+                result = await session.execute(
+                    update(Post).where(Post.image_sha256 == sha256).values(thumbnail_url=urls["thumb"])
+                )
+                await session.execute(
+                    update(Proof).where(Proof.blob_sha256 == sha256)
+                    .values(thumbnail_url=urls["thumb"], preview_url=urls["preview"])
+                )
+                await session.commit()
+            if result.rowcount:
+                feed_cache.invalidate()  # В ленте появилась миниатюра
+        except Exception as e:
+            logger.error(f"Derivatives for blob {sha256} failed: {e}")
+
+    async def stop(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+derivatives = DerivativePipeline(settings.DERIVATIVE_WORKERS)
@@ -0,0 +1,14 @@
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+
+
+class Blob(SQLModel, table=True):
+    """Содержимое загруженного файла, хранится один раз на SHA-256"""
+    __tablename__ = "blobs"
+
+    sha256: str = Field(primary_key=True)
+    file_type: str  # jpg / png / pdf
+    size: int
+    ref_count: int = Field(default=0)  # Сколько постов/доказательств ссылается на файл
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,109 @@
+"""
+Контентно-адресуемое хранилище загрузок.
+
+Файл лежит по своему SHA-256: uploads/blobs/ab/cd/abcd....pdf. Повторная загрузка того же содержимого
+не создает новую копию, а увеличивает счетчик ссылок. Файл удаляется с диска, когда на него
+не остается ни одной ссылки.
+
+Ссылка на blob и его файл меняются под advisory-lock'ом по sha256 (lock_blob): загрузка держит его
+от upsert счетчика до своего коммита и кладет файл на место только под ним, а удаление файлов
+(purge_files) под ним же перепроверяет, что строки blob все еще нет.
+"""
+import os
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import UploadFile
+from sqlalchemy import delete, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.core.db import async_session_maker, dialect_insert
+from app.core.uploads import TMP_DIR, UPLOAD_ROOT, StoredFile, save_upload
+from app.modules.storage.models import Blob
+
+BLOB_DIR = UPLOAD_ROOT / "blobs"
+
+
+def blob_path(sha256: str, file_type: str, variant: Optional[str] = None) -> Path:
+    """Путь к blob или его производной (превью, миниатюра) — они лежат рядом с оригиналом"""
+    name = f"{sha256}.{variant}.{file_type}" if variant else f"{sha256}.{file_type}"
+    return BLOB_DIR / sha256[:2] / sha256[2:4] / name
+
+
+def blob_url(sha256: str, file_type: str, variant: Optional[str] = None) -> str:
+    # uploads раздается по /static
+    return "/static/" + blob_path(sha256, file_type, variant).relative_to(UPLOAD_ROOT).as_posix()
+
+
+async def lock_blob(session: AsyncSession, sha256: str):
+    """Транзакционная блокировка одного blob (только Postgres; SQLite и так пишет по одному)"""
+    if session.bind.dialect.name == "postgresql":
+        await session.execute(text("SELECT pg_advisory_xact_lock(hashtextextended(:sha256, 0))"), {"sha256": sha256})
+
+
+async def store_blob(session: AsyncSession, file: UploadFile, kind: str) -> StoredFile:
+    """
+    Сохраняет загрузку как blob и берет на него ссылку.
+    Коммит — за вызывающим, вместе со строкой, которая на blob ссылается; до него blob заблокирован.
+    """
+    # Сначала во временный файл: на место он встает только после того, как ссылка взята под блокировкой
+    stored = await save_upload(file, kind, lambda sha256, file_type: TMP_DIR / f"blob-{uuid.uuid4().hex}.{file_type}")
+    try:
+        await lock_blob(session, stored.sha256)
+        insert = dialect_insert(session)
+        stmt = insert(Blob).values(sha256=stored.sha256, file_type=stored.file_type, size=stored.size, ref_count=1)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[Blob.sha256],
+            set_={"ref_count": Blob.ref_count + 1},
+        ))
+        path = blob_path(stored.sha256, stored.file_type)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        await run_in_threadpool(os.replace, stored.path, path)
+    except BaseException:
+        if stored.path.exists():
+            os.remove(stored.path)
+        raise
+    stored.path = path
+    return stored
+
+
+async def release_blob(session: AsyncSession, sha256: Optional[str]) -> List[Path]:
+    """
+    Снимает ссылку на blob. Возвращает файлы, которые надо удалить с диска
+    после коммита (purge_files) — если удалить раньше, откат транзакции оставит битую ссылку.
+    """
+    if not sha256:
+        return []
+    await session.execute(
+        update(Blob).where(Blob.sha256 == sha256).values(ref_count=Blob.ref_count - 1)
+    )
+    result = await session.execute(
+        delete(Blob).where(Blob.sha256 == sha256, Blob.ref_count <= 0).returning(Blob.sha256, Blob.file_type)
+    )
+    return [blob_path(sha, file_type) for sha, file_type in result.all()]
+
+
+def _remove_blob_files(path: Path):
+    # Вместе с оригиналом уходят и его производные (<sha>.thumb.webp и т.п.)
+    sha256 = path.name.split(".", 1)[0]
+    for file in path.parent.glob(f"{sha256}.*"):
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+
+
+async def purge_files(paths: List[Path]):
+    """
+    Удаляет файлы blob'ов, на которые не осталось ссылок. Вызывать после коммита: под блокировкой blob'а
+    проверяется, что его строки нет — параллельная загрузка того же содержимого могла снова на него сослаться.
+    """
+    for path in paths:
+        sha256 = path.name.split(".", 1)[0]
+        async with async_session_maker() as session:
+            await lock_blob(session, sha256)
+            if await session.get(Blob, sha256) is None:
+                await run_in_threadpool(_remove_blob_files, path)
+            await session.commit()
@@ -0,0 +1,263 @@
+"""
+Воспроизводимый прогон основных эндпоинтов с базовой линией.
+
+Наполняет БД (N студентов, M транзакций леджера, P постов), затем по очереди гоняет сценарии
+login / accrue / history / posts / upload с заданной конкурентностью и пишет в JSON
+пропускную способность и p50/p95/p99 по каждому сценарию:
+    python -m benchmarks.harness run --users 1000 --transactions 20000 --output baseline.json
+    python -m benchmarks.harness run --output after.json --compare baseline.json
+    python -m benchmarks.harness compare baseline.json after.json --threshold 0.1
+
+По умолчанию приложение крутится в процессе (httpx.ASGITransport) на SQLite в памяти.
+Для Postgres: --database-url postgresql+asyncpg://... — ВСЕ ТАБЛИЦЫ ЭТОЙ БД ПЕРЕСОЗДАЮТСЯ,
+берите отдельную базу. С --base-url запросы идут в уже запущенный uvicorn (он должен смотреть
+в ту же БД, с тем же SECRET_KEY и LEDGER_SIGNING_KEY, и с RATE_LIMIT_ENABLED=false).
+
+compare завершается с кодом 1, если какой-то сценарий потерял больше threshold по req/s
+или настолько же вырос по p95 — так регрессию видно в CI.
+
+Нужны httpx и aiosqlite (pip install httpx aiosqlite).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+import httpx
+
+from benchmarks.login_load import percentile
+
+SCENARIOS = ["login", "accrue", "history", "posts", "upload"]
+PASSWORD = "bench-password"
+# Минимальный валидный PNG 1x1: проходит проверку сигнатуры в save_upload
+PNG_1X1 = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082"
+)
+
+
+def configure_environment(args):
+    """Настройки читаются при импорте app.*, поэтому окружение выставляется до него"""
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    os.environ.setdefault("PROJECT_NAME", "Kiibiki Benchmark")
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")  # Логи на каждый запрос исказят цифры
+    if not os.environ.get("LEDGER_SIGNING_KEY"):
+        from app.modules.ledger.crypto import generate_key_pair
+        os.environ["LEDGER_SIGNING_KEY"] = generate_key_pair()["private_key"]
+
+
+async def reset_schema():
+    """Пересоздает схему. Вызывается до lifespan: фоновые службы (рейтинг, блоки Меркла) сразу читают таблицы"""
+    from sqlmodel import SQLModel
+
+    from app.core.db import engine
+    import app.main  # noqa: F401 — регистрирует все модели в metadata
+
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.drop_all)
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+
+async def seed(args) -> Dict[str, object]:
+    """Наполняет схему; транзакции идут через писателя леджера, так что цепочка валидна"""
+    from app.core.db import async_session_maker
+    from app.core.security import get_password_hash
+    from app.modules.auth.models import User, UserRole
+    from app.modules.ledger.keys import key_registry
+    from app.modules.ledger.service import LedgerEntry, ledger_appender
+    from app.modules.posts.models import Post
+
+    hashed = get_password_hash(PASSWORD)  # bcrypt один раз на всех, иначе наполнение займет минуты
+    async with async_session_maker() as session:
+        admin = User(username="bench_admin", full_name="Bench Admin", hashed_password=hashed, role=UserRole.ADMIN)
+        students = [
+            User(username=f"bench_{i:06d}", full_name=f"Student {i}", hashed_password=hashed,
+                 group_number=f"G{i % 20:02d}")
+            for i in range(args.users)
+        ]
+        session.add(admin)
+        session.add_all(students)
+        await session.commit()
+        admin_id = admin.id
+        student_ids = [student.id for student in students]
+        usernames = [student.username for student in students]
+
+        now = datetime.now()
+        session.add_all([
+            Post(title=f"Post {i}", content="benchmark " * 50, author_id=admin_id, created_at=now - timedelta(minutes=i))
+            for i in range(args.posts)
+        ])
+        await session.commit()
+
+    rng = random.Random(args.seed)
+    async with async_session_maker() as session:
+        key_id, key = await key_registry.signer(session, admin_id)
+    for offset in range(0, args.transactions, 1000):
+        await ledger_appender.append_many([
+            LedgerEntry(rng.choice(student_ids), admin_id, rng.randint(1, 50), "seed", key, key_id)
+            for _ in range(min(1000, args.transactions - offset))
+        ])
+    return {"admin": "bench_admin", "usernames": usernames}
+
+
+def build_requests(client: httpx.AsyncClient, api: str, data: dict, rng: random.Random) -> Dict[str, Callable]:
+    from app.core.security import create_access_token
+
+    admin_headers = {"Authorization": f"Bearer {create_access_token(data['admin'])}"}
+    student_tokens = {name: create_access_token(name) for name in data["usernames"][:200]}
+
+    def student_headers():
+        return {"Authorization": f"Bearer {student_tokens[rng.choice(list(student_tokens))]}"}
+
+    return {
+        "login": lambda: client.post(f"{api}/auth/login",
+                                     data={"username": rng.choice(data["usernames"]), "password": PASSWORD}),
+        "accrue": lambda: client.post(f"{api}/ledger/accrue", headers=admin_headers,
+                                      json={"username": rng.choice(data["usernames"]), "amount": 1, "reason": "bench"}),
+        "history": lambda: client.get(f"{api}/ledger/history", headers=student_headers()),
+        "posts": lambda: client.get(f"{api}/posts/"),
+        "upload": lambda: client.post(f"{api}/upload", headers=student_headers(),
+                                      files={"file": ("bench.png", PNG_1X1, "image/png")}),
+    }
+
+
+async def drive(send: Callable, requests: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await send()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def run(args) -> dict:
+    configure_environment(args)
+    from app.core.db import engine
+    from app.main import app
+    from app.modules.leaderboard.service import leaderboard
+
+    await reset_schema()
+    async with app.router.lifespan_context(app):
+        data = await seed(args)
+        await leaderboard.rebuild()  # Студенты появились уже после старта рейтинга
+        if args.base_url:
+            client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+        else:
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+        async with client:
+            requests = build_requests(client, args.api, data, random.Random(args.seed))
+            results = {}
+            for name in args.scenarios:
+                await drive(requests[name], min(args.requests, 20), 1)  # Прогрев кэшей и пула
+                results[name] = await drive(requests[name], args.requests, args.concurrency)
+                print(f"{name:8} " + "  ".join(f"{k}={v}" for k, v in results[name].items()))
+    await engine.dispose()
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "database": args.database_url.split("://", 1)[0],
+            "target": args.base_url or "in-process",
+            "python": platform.python_version(),
+            "users": args.users,
+            "transactions": args.transactions,
+            "posts": args.posts,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "scenarios": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """Печатает разницу по сценариям; False, если есть регрессия больше threshold"""
+    ok = True
+    print(f"{'scenario':8} {'rps':>22} {'p95_ms':>22} {'p99_ms':>22}")
+    for name, now in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            print(f"{name:8} (нет в базовой линии)")
+            continue
+        rps_change = now["rps"] / before["rps"] - 1 if before["rps"] else 0.0
+        p95_change = now["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        regressed = rps_change < -threshold or p95_change > threshold
+        ok = ok and not regressed
+        print(
+            f"{name:8} {before['rps']:>9} -> {now['rps']:<9}{rps_change:+6.1%}"
+            f" {before['p95_ms']:>9} -> {now['p95_ms']:<9}{p95_change:+6.1%}"
+            f" {before['p99_ms']:>9} -> {now['p99_ms']:<9}"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Наполнить БД и прогнать сценарии")
+    run_parser.add_argument("--database-url", default="sqlite+aiosqlite:///:memory:")
+    run_parser.add_argument("--base-url", help="Гонять запросы в запущенный сервер, а не в процессе")
+    run_parser.add_argument("--api", default="/api/v1")
+    run_parser.add_argument("--users", type=int, default=1000)
+    run_parser.add_argument("--transactions", type=int, default=10000)
+    run_parser.add_argument("--posts", type=int, default=200)
+    run_parser.add_argument("--requests", type=int, default=500, help="Запросов на сценарий")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--output", help="Куда записать результат (JSON)")
+    run_parser.add_argument("--compare", help="Базовая линия для сравнения")
+    run_parser.add_argument("--threshold", type=float, default=0.10)
+
+    compare_parser = commands.add_parser("compare", help="Сравнить два сохраненных прогона")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.baseline) as f_base, open(args.current) as f_current:
+            sys.exit(0 if compare(json.load(f_base), json.load(f_current), args.threshold) else 1)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare) as f:
+            sys.exit(0 if compare(json.load(f), result, args.threshold) else 1)
+
+
+if __name__ == "__main__":
+    main()
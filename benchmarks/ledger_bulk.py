@@ -0,0 +1,97 @@
+"""
+Начисление N студентам: N запросов /ledger/accrue против одного /ledger/accrue/bulk.
+
+Меряется весь путь — HTTP (приложение в процессе через httpx.ASGITransport), JWT, поиск
+пользователей, цепочка, подпись, коммит и обновление балансов:
+    python -m benchmarks.ledger_bulk --count 1000
+    python -m benchmarks.ledger_bulk --count 1000 --concurrency 16 --database-url postgresql+asyncpg://...
+
+По умолчанию — SQLite в памяти; с --database-url ВСЕ ТАБЛИЦЫ ЭТОЙ БД ПЕРЕСОЗДАЮТСЯ, берите отдельную базу.
+count не больше LEDGER_BULK_MAX_RECIPIENTS. Нужны httpx и aiosqlite (pip install httpx aiosqlite).
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.harness import PASSWORD, configure_environment, reset_schema
+
+GROUP = "BULK"
+
+
+async def seed(count: int) -> List[str]:
+    from app.core.db import async_session_maker
+    from app.core.security import get_password_hash
+    from app.modules.auth.models import User, UserRole
+
+    hashed = get_password_hash(PASSWORD)
+    usernames = [f"bulk_{i:06d}" for i in range(count)]
+    async with async_session_maker() as session:
+        session.add(User(username="bench_admin", full_name="Bench Admin", hashed_password=hashed, role=UserRole.ADMIN))
+        session.add_all([
+            User(username=username, full_name=username, hashed_password=hashed, group_number=GROUP)
+            for username in usernames
+        ])
+        await session.commit()
+    return usernames
+
+
+async def per_request(client: httpx.AsyncClient, api: str, headers: Dict[str, str],
+                      usernames: List[str], concurrency: int) -> float:
+    pending = list(usernames)
+
+    async def worker():
+        while pending:
+            username = pending.pop()
+            response = await client.post(f"{api}/ledger/accrue", headers=headers,
+                                         json={"username": username, "amount": 10, "reason": "bench"})
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def bulk(client: httpx.AsyncClient, api: str, headers: Dict[str, str]) -> float:
+    start = time.perf_counter()
+    response = await client.post(f"{api}/ledger/accrue/bulk", headers=headers,
+                                 json={"group_number": GROUP, "amount": 10, "reason": "bench"})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run(args):
+    configure_environment(args)
+    from app.core.db import engine
+    from app.core.security import create_access_token
+    from app.main import app
+
+    await reset_schema()
+    async with app.router.lifespan_context(app):
+        usernames = await seed(args.count)
+        headers = {"Authorization": f"Bearer {create_access_token('bench_admin')}"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            single = await per_request(client, args.api, headers, usernames, args.concurrency)
+            grouped = await bulk(client, args.api, headers)
+    await engine.dispose()
+
+    print(f"recipients:   {args.count}")
+    print(f"per-request:  {single:.3f}s  ({args.count / single:,.0f} accruals/s, concurrency {args.concurrency})")
+    print(f"bulk:         {grouped:.3f}s  ({args.count / grouped:,.0f} accruals/s, 1 request)")
+    print(f"speedup:      x{single / grouped:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///:memory:")
+    parser.add_argument("--api", default="/api/v1")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
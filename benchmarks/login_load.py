@@ -0,0 +1,77 @@
+"""
+Нагрузка логинами и задержка остальных эндпоинтов.
+
+Пока N клиентов долбят /auth/login, отдельные клиенты меряют /health и /ledger/history.
+Если bcrypt блокирует event loop, p99 у "легких" эндпоинтов вырастает до сотен миллисекунд.
+
+Сервер должен быть запущен с RATE_LIMIT_ENABLED=false, иначе логины упрутся в 5/minute:
+    RATE_LIMIT_ENABLED=false uvicorn app.main:app
+    python -m benchmarks.login_load --username student --password secret --duration 20
+
+Нужен httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def hammer_login(client: httpx.AsyncClient, args, deadline: float, stats: Dict[str, List[float]]):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.post(f"{args.api}/auth/login", data={"username": args.username, "password": args.password})
+        stats["login"].append(time.perf_counter() - start)
+
+
+async def probe(client: httpx.AsyncClient, url: str, headers: dict, deadline: float, samples: List[float]):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get(url, headers=headers)
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as client:
+        response = await client.post(f"{args.api}/auth/login", data={"username": args.username, "password": args.password})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        stats: Dict[str, List[float]] = {"login": [], "/health": [], "/ledger/history": []}
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *(hammer_login(client, args, deadline, stats) for _ in range(args.login_concurrency)),
+            probe(client, "/health", {}, deadline, stats["/health"]),
+            probe(client, f"{args.api}/ledger/history", headers, deadline, stats["/ledger/history"]),
+        )
+
+    for name, samples in stats.items():
+        if not samples:
+            continue
+        print(f"{name:18} n={len(samples):6}  p50={percentile(samples, 0.5) * 1000:8.1f}ms  "
+              f"p99={percentile(samples, 0.99) * 1000:8.1f}ms  mean={statistics.mean(samples) * 1000:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api", default="/api/v1")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--login-concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
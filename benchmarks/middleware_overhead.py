@@ -0,0 +1,95 @@
+"""
+Накладные расходы мидлварей на /health.
+
+Сравнивает старые мидлвари на BaseHTTPMiddleware с текущими чистыми ASGI из app.core.middleware.
+Приложение крутится в процессе через httpx.ASGITransport — без сети и uvicorn, поэтому разница
+в req/s приходится только на стек мидлварей (и БД не нужна):
+    python -m benchmarks.middleware_overhead --requests 20000
+
+Нужен httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.middleware import ProcessTimeMiddleware, SecurityHeadersMiddleware
+
+WARMUP_REQUESTS = 100
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+        return response
+
+
+class LegacyProcessTimeMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        response.headers["X-Process-Time"] = str(time.time() - start_time)
+        return response
+
+
+def build_app(security, process_time) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "ok", "system": "Kiibiki Secure Reward System"}
+
+    app.add_middleware(security)
+    app.add_middleware(process_time)
+    return app
+
+
+async def measure(app: FastAPI, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = 0
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                response = await client.get("/health")
+                assert "X-Process-Time" in response.headers and "X-Frame-Options" in response.headers
+
+        # Прогрев — отдельные запросы, в замер не входят
+        remaining = WARMUP_REQUESTS
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        remaining = total
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - start)
+
+
+async def run(args):
+    variants = {
+        "BaseHTTPMiddleware": build_app(LegacySecurityHeadersMiddleware, LegacyProcessTimeMiddleware),
+        "pure ASGI": build_app(SecurityHeadersMiddleware, ProcessTimeMiddleware),
+    }
+    results = {}
+    for name, app in variants.items():
+        results[name] = await measure(app, args.requests, args.concurrency)
+        print(f"{name:20} {results[name]:10.0f} req/s")
+    before, after = results["BaseHTTPMiddleware"], results["pure ASGI"]
+    print(f"{'speedup':20} {after / before:10.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,8 @@ export const Dashboard = () => {
   // --- Состояния данных ---
   const [user, setUser] = useState<UserProfile | null>(null);
   const [transactions, setTransactions] = useState<Transaction[]>([]);
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null); // Курсор следующей страницы истории
+  const [loadingMore, setLoadingMore] = useState(false);
   const [posts, setPosts] = useState<Post[]>([]);
   const [loading, setLoading] = useState(true);
 
@@ -75,6 +77,7 @@ export const Dashboard = () => {
       try {
         const historyRes = await api.get('/ledger/history');
         setTransactions(historyRes.data);
+        setHistoryCursor(historyRes.headers['x-next-cursor'] ?? null);
       } catch (e) { console.error("Ошибка загрузки истории", e); }
 
       // 3. Новости
@@ -94,6 +97,21 @@ export const Dashboard = () => {
     fetchData();
   }, []);
 
+  // История отдается страницами: следующая — по курсору из заголовка X-Next-Cursor
+  const loadMoreHistory = async () => {
+    if (!historyCursor) return;
+    setLoadingMore(true);
+    try {
+      const historyRes = await api.get('/ledger/history', { params: { cursor: historyCursor } });
+      setTransactions(prev => [...prev, ...historyRes.data]);
+      setHistoryCursor(historyRes.headers['x-next-cursor'] ?? null);
+    } catch (e) {
+      console.error("Ошибка загрузки истории", e);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleLogout = () => {
     logout();
     navigate('/login');
@@ -273,6 +291,11 @@ export const Dashboard = () => {
                     ))}
                   </ul>
                 )}
+                {historyCursor && (
+                  <Button variant="outline" className="w-full mt-4" onClick={loadMoreHistory} disabled={loadingMore}>
+                    {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+                  </Button>
+                )}
              </div>
           </div>
 